@@ -0,0 +1,101 @@
+"""Check the threshold simulator against a plain replay of every combination.
+
+Records a synthetic daily history (pruned as real runs prune it), then
+replays it once per combination of a small grid with score_candidates() and
+top_k(), the code real runs use, and fails unless simulate.simulate()
+featured exactly as many repos in every edition:
+
+    python benchmarks/check_simulate.py
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from fixtures import record_history, temp_database
+
+import scoring
+from database import DAY_SECONDS
+from scoring import score_candidates, top_k
+from simulate import THRESHOLDS, load_history, parse_grid, simulate
+
+# Small enough to replay combination by combination, with several values
+# on every threshold
+CHECK_GRID = [
+    'cooldown_days=3,7,14',
+    'weekly_likes_growth=0.05,0.25,0.5',
+    'weekly_downloads_growth=0.25,0.5',
+    'total_likes_growth=0.5,2',
+    'total_downloads_growth=1,5'
+]
+
+def replay(history, thresholds, limit):
+    """Featured repos per edition for one combination, the slow way."""
+    # score_candidates() reads the thresholds from the scoring module
+    names = [name.upper() for name in THRESHOLDS]
+    saved = [getattr(scoring, name) for name in names]
+    for name, value in zip(names, thresholds):
+        setattr(scoring, name, value)
+    try:
+        editions, repos = history['likes'].shape
+        last = np.full(repos, -1)
+        last[history['columns'][0]] = 0
+        featured = []
+        for edition in range(1, editions):
+            count = 0
+            columns = history['columns'][edition]
+            types = history['types'][columns]
+            for code in np.unique(types):
+                repo = columns[types == code]
+                is_new = last[repo] < 0
+                seen = np.where(is_new, edition, last[repo])
+                current = history['downloads'][edition, repo]
+                previous = history['downloads'][seen, repo]
+                if np.isnan(current).all():
+                    downloads = prev_downloads = None
+                else:
+                    missing = np.isnan(current) | np.isnan(previous)
+                    downloads = np.where(missing, 1, current)
+                    prev_downloads = np.where(missing, 1, previous)
+                scores = score_candidates(
+                    history['likes'][edition, repo], downloads,
+                    history['likes'][seen, repo], prev_downloads,
+                    (history['ts'][edition] - history['ts'][seen]) // DAY_SECONDS, is_new
+                )
+                chosen = repo[top_k(scores['score'], scores['worthy'], limit)]
+                last[chosen] = edition
+                count += len(chosen)
+            featured.append(count)
+        return featured
+    finally:
+        for name, value in zip(names, saved):
+            setattr(scoring, name, value)
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the threshold simulator')
+    parser.add_argument('--days', type=int, default=60, help='Days of synthetic history')
+    parser.add_argument('--size', type=int, default=200, help='Repos listed per type and run')
+    parser.add_argument('--limit', type=int, default=10, help='Repos featured per type')
+    args = parser.parse_args()
+
+    with temp_database() as (db, _):
+        record_history(db, days=args.days, size=args.size, prune=True)
+        history = load_history(db)
+    combinations, featured = simulate(history, parse_grid(CHECK_GRID), args.limit)
+
+    mismatches = 0
+    for combination, simulated in zip(combinations, featured):
+        expected = replay(history, combination, args.limit)
+        if list(simulated) != expected:
+            mismatches += 1
+            if mismatches <= 5:
+                print(f"MISMATCH {dict(zip(THRESHOLDS, combination.tolist()))}")
+
+    print(f"{len(combinations)} combinations over {featured.shape[1]} editions, "
+          f"{mismatches} mismatched")
+    if mismatches:
+        sys.exit(1)
+    print("OK")
+
+if __name__ == '__main__':
+    main()
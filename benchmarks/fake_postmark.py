@@ -0,0 +1,125 @@
+"""Local stand-in for the Postmark HTTP API.
+
+Implements POST /email and POST /email/batch with Postmark's response format,
+optional latency and a configurable rate of transient (HTTP 500) failures.
+Point the newsletter at it with:
+
+    POSTMARK_API_URL=http://127.0.0.1:8025/ POSTMARK_TOKEN=POSTMARK_API_TEST python src/cli.py
+
+It can also be started in-process with FakePostmarkServer().
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0))
+        data = json.loads(self.rfile.read(length) or b'null')
+
+        if server.latency:
+            time.sleep(server.latency)
+        if server.failure_rate and server.random.random() < server.failure_rate:
+            server.record(failed_calls=1)
+            self._reply(500, {'ErrorCode': 500, 'Message': 'Simulated server error'})
+            return
+
+        if self.path.rstrip('/') == '/email/batch':
+            results = [server.accept(message) for message in data]
+            server.record(calls=1)
+            self._reply(200, results)
+        elif self.path.rstrip('/') == '/email':
+            server.record(calls=1)
+            self._reply(200, server.accept(data))
+        else:
+            self._reply(404, {'ErrorCode': 404, 'Message': 'Not found'})
+
+class FakePostmarkServer(ThreadingHTTPServer):
+    """Threaded fake Postmark server that records every accepted message."""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, failure_rate=0.0, seed=0):
+        super().__init__((host, port), _Handler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.messages = []
+        self.calls = 0
+        self.failed_calls = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def accept(self, message):
+        with self._lock:
+            self.messages.append(message)
+        return {
+            'To': message.get('To'),
+            'SubmittedAt': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'MessageID': str(uuid.uuid4()),
+            'ErrorCode': 0,
+            'Message': 'OK'
+        }
+
+    def record(self, calls=0, failed_calls=0):
+        with self._lock:
+            self.calls += calls
+            self.failed_calls += failed_calls
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description='Fake Postmark API server')
+    parser.add_argument('--port', type=int, default=8025)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='Seconds to wait before answering each request')
+    parser.add_argument('--failure-rate', type=float, default=0.0,
+                        help='Fraction of requests answered with HTTP 500')
+    args = parser.parse_args()
+
+    server = FakePostmarkServer(port=args.port, latency=args.latency, failure_rate=args.failure_rate)
+    print(f"Fake Postmark listening on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"Accepted {len(server.messages)} messages in {server.calls} calls")
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""Synthetic stand-ins for the Hugging Face Hub, Postmark and the database."""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'src'))
+
+from database import Database
+
+TAGS = ['transformers', 'pytorch', 'text-generation', 'image-classification',
+        'safetensors', 'en', 'license:mit', 'license:apache-2.0', 'diffusers', 'gguf']
+
+class FakeHTTPError(Exception):
+    """Mimics the response attribute of huggingface_hub's HTTP errors."""
+
+    class _Response:
+        def __init__(self, status_code, headers):
+            self.status_code = status_code
+            self.headers = headers
+
+    def __init__(self, status_code, retry_after=None):
+        super().__init__(f"HTTP {status_code}")
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+        self.response = self._Response(status_code, headers)
+
+class FakeCardData(dict):
+    pass
+
+class FakeModel:
+    """Listing entry with the attributes HfApi.list_models returns."""
+
+    def __init__(self, index, rng, now):
+        namespace = f"org{index % 997}"
+        self.modelId = self.id = f"{namespace}/model-{index}"
+        self.author = namespace
+        self.sha = uuid.UUID(int=rng.getrandbits(128)).hex
+        self.downloads = max(0, 10_000_000 // (index + 1) + rng.randint(0, 1000))
+        self.likes = rng.randint(0, 5000)
+        self.lastModified = now - timedelta(days=rng.randint(0, 365))
+        self.tags = rng.sample(TAGS, 4)
+
+class FakeRepo:
+    """Dataset or Space listing entry, with the newer snake_case attributes.
+
+    Spaces have no download count and are listed by likes.
+    """
+
+    def __init__(self, kind, index, rng, now):
+        namespace = f"org{index % 997}"
+        self.id = f"{namespace}/{kind}-{index}"
+        self.author = namespace
+        self.sha = uuid.UUID(int=rng.getrandbits(128)).hex
+        if kind == 'space':
+            self.likes = max(0, 100_000 // (index + 1) + rng.randint(0, 100))
+        else:
+            self.downloads = max(0, 1_000_000 // (index + 1) + rng.randint(0, 1000))
+            self.likes = rng.randint(0, 2000)
+        self.last_modified = now - timedelta(days=rng.randint(0, 365))
+        self.tags = rng.sample(TAGS, 3)
+
+class FakeModelInfo:
+    def __init__(self, model):
+        self.modelId = model.modelId
+        self.lastModified = model.lastModified
+        self.cardData = FakeCardData({'model-description': f"Synthetic description of {model.modelId}"})
+
+class FakeRepoInfo:
+    def __init__(self, repo):
+        self.id = repo.id
+        self.last_modified = repo.last_modified
+        self.card_data = FakeCardData({'model-description': f"Synthetic description of {repo.id}"})
+
+class FakeHfApi:
+    """HfApi replacement serving synthetic, popularity-ordered listings.
+
+    Models, datasets and Spaces are all available; n_datasets and n_spaces
+    default to n_models. list_latency is paid per page of page_size repos,
+    info_latency per info call. A throttle_rate fraction of info calls fails
+    once with HTTP 429 and a Retry-After header.
+    """
+
+    def __init__(self, n_models=500, list_latency=0.0, info_latency=0.0, throttle_rate=0.0,
+                 page_size=1000, seed=0, n_datasets=None, n_spaces=None):
+        rng = random.Random(seed)
+        now = datetime.now(timezone.utc)
+        self.models = [FakeModel(i, rng, now) for i in range(n_models)]
+        self.datasets = [FakeRepo('dataset', i, rng, now)
+                         for i in range(n_models if n_datasets is None else n_datasets)]
+        self.spaces = [FakeRepo('space', i, rng, now)
+                       for i in range(n_models if n_spaces is None else n_spaces)]
+        self._listings = {'model': self.models, 'dataset': self.datasets, 'space': self.spaces}
+        self._by_id = {kind: {repo.id: repo for repo in repos}
+                       for kind, repos in self._listings.items()}
+        self.list_latency = list_latency
+        self.info_latency = info_latency
+        self.throttle_rate = throttle_rate
+        self.page_size = page_size
+        self._rng = random.Random(seed + 1)
+        self._throttled = set()
+        self._lock = threading.Lock()
+        self.list_calls = 0
+        self.info_calls = 0
+
+    def list_models(self, limit=None, **kwargs):
+        return self._list('model', limit)
+
+    def list_datasets(self, limit=None, **kwargs):
+        return self._list('dataset', limit)
+
+    def list_spaces(self, limit=None, **kwargs):
+        return self._list('space', limit)
+
+    def model_info(self, repo_id, timeout=None, **kwargs):
+        return FakeModelInfo(self._info('model', repo_id))
+
+    def dataset_info(self, repo_id, timeout=None, **kwargs):
+        return FakeRepoInfo(self._info('dataset', repo_id))
+
+    def space_info(self, repo_id, timeout=None, **kwargs):
+        return FakeRepoInfo(self._info('space', repo_id))
+
+    def _list(self, kind, limit):
+        repos = self._listings[kind]
+        repos = repos[:limit] if limit is not None else repos
+        for i, repo in enumerate(repos):
+            if i % self.page_size == 0:
+                with self._lock:
+                    self.list_calls += 1
+                if self.list_latency:
+                    time.sleep(self.list_latency)
+            yield repo
+
+    def _info(self, kind, repo_id):
+        with self._lock:
+            self.info_calls += 1
+            throttle = ((kind, repo_id) not in self._throttled
+                        and self._rng.random() < self.throttle_rate)
+            if throttle:
+                self._throttled.add((kind, repo_id))
+        if self.info_latency:
+            time.sleep(self.info_latency)
+        if throttle:
+            raise FakeHTTPError(429, retry_after=0)
+        return self._by_id[kind][repo_id]
+
+    @property
+    def api_calls(self):
+        return self.list_calls + self.info_calls
+
+class _FakeEmails:
+    def __init__(self, client):
+        self._client = client
+
+    def send(self, **message):
+        return self.send_batch(message)[0]
+
+    def send_batch(self, *messages):
+        client = self._client
+        if client.latency:
+            time.sleep(client.latency)
+        with client._lock:
+            client.calls += 1
+            client.messages += len(messages)
+        return [{'To': message['To'], 'MessageID': str(uuid.uuid4()), 'ErrorCode': 0,
+                 'Message': 'OK'} for message in messages]
+
+class FakePostmarkClient:
+    """In-process PostmarkClient replacement that only counts messages.
+
+    Use benchmarks/fake_postmark.py instead to exercise the real HTTP client.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = 0
+        self.messages = 0
+        self._lock = threading.Lock()
+        self.emails = _FakeEmails(self)
+
+class QueryCounter:
+    """Counts statements executed on a Database's connections.
+
+    An executemany() counts once, like one round trip, however many rows it
+    has (see Database.set_trace_callback).
+    """
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, statement):
+        with self._lock:
+            self.count += 1
+
+    def reset(self):
+        with self._lock:
+            self.count = 0
+
+@contextmanager
+def temp_database(**kwargs):
+    """A Database in a throwaway directory, with a QueryCounter attached."""
+    directory = tempfile.mkdtemp(prefix='hf_newsletter_bench_')
+    counter = QueryCounter()
+    db = Database(os.path.join(directory, 'newsletter.db'), **kwargs)
+    db.set_trace_callback(counter)
+    try:
+        yield db, counter
+    finally:
+        db.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+def record_history(db, days=365, size=500, repo_types=('model', 'dataset', 'space'), seed=0,
+                   prune=False):
+    """Record a daily snapshot history of `days` runs, ending today.
+
+    Each repo type has a pool of repos whose counts grow slowly, with the
+    occasional burst, and whose top `size` are listed each day; a few new
+    repos join every day. Spaces have no downloads and are ranked by likes.
+    With prune=True the retention policy is applied after each day, as every
+    run does. Returns the seconds spent pruning, one entry per day.
+    """
+    rng = random.Random(seed)
+    start = int(time.time()) - days * 86400
+    pools, prune_seconds = {}, []
+    for repo_type in repo_types:
+        pools[repo_type] = [
+            [f"org{i % 997}/{repo_type}-{i}", rng.randint(0, 5000), 10_000_000 // (i + 1)]
+            for i in range(size * 3 // 2)
+        ]
+    for day in range(days):
+        for repo_type, pool in pools.items():
+            for repo in pool:
+                draw = rng.random()
+                if draw < 0.002:
+                    repo[1] += repo[1] // 2
+                    repo[2] *= 2
+                repo[1] += int(draw * 4)
+                repo[2] = int(repo[2] * (0.96 + 0.08 * draw))
+            for _ in range(size // 100):
+                pool.append([f"new/{repo_type}-{day}-{len(pool)}", rng.randint(1, 200),
+                             rng.randint(10_000, 1_000_000)])
+            key = 1 if repo_type == 'space' else 2
+            pool.sort(key=lambda repo: repo[key], reverse=True)
+            del pool[size * 3 // 2:]
+            db.record_snapshots(
+                ((repo_id, likes, None if repo_type == 'space' else downloads, rank)
+                 for rank, (repo_id, likes, downloads) in enumerate(pool[:size])),
+                ts=start + day * 86400, repo_type=repo_type
+            )
+        if prune:
+            began = time.perf_counter()
+            db.prune_snapshots(now=start + day * 86400)
+            prune_seconds.append(time.perf_counter() - began)
+    return prune_seconds
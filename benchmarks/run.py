@@ -0,0 +1,293 @@
+"""Benchmark the newsletter pipeline against synthetic fixtures.
+
+Runs each pipeline stage and the end-to-end run for several listing sizes and
+writes the results as JSON, so they can be compared across commits:
+
+    python benchmarks/run.py --sizes 500 5000 50000 --output before.json
+    python benchmarks/run.py --sizes 500 5000 50000 --output after.json --compare before.json
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from fixtures import TAGS, FakeHfApi, FakePostmarkClient, record_history, temp_database
+
+import newsletter
+from outbox import queue_edition, drain_edition
+from scoring import top_k
+from simulate import DEFAULT_GRID, run_simulation
+
+RESULTS_DIR = Path(__file__).resolve().parent / 'results'
+
+@contextmanager
+def timed(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+            cwd=Path(__file__).resolve().parent
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def bench_stages(size, args):
+    """Time each stage of the pipeline separately."""
+    api = FakeHfApi(size, list_latency=args.list_latency, info_latency=args.info_latency,
+                    throttle_rate=args.throttle_rate)
+    timings = {}
+    with temp_database() as (db, queries):
+        with timed(timings, 'listing'):
+            models = list(newsletter.list_popular_models(api, size))
+        with timed(timings, 'snapshot'):
+            db.record_snapshots(
+                (model.model_id, model.likes, model.downloads, rank)
+                for rank, model in enumerate(models, 1)
+            )
+            db.get_snapshot_growth()
+        with timed(timings, 'scoring'):
+            all_metrics, scores = newsletter.score_models(db, models)
+            selected = top_k(scores['score'], scores['worthy'], args.limit)
+        with timed(timings, 'enrichment'):
+            newsletter.enrich_models(api, [models[i].model_id for i in selected],
+                                     max_workers=args.workers, backoff=0)
+    return timings
+
+def bench_end_to_end(size, args):
+    """Run fetch, render and delivery as the CLI does, twice.
+
+    The second run sees the history written by the first, like a daily run
+    against an existing database.
+    """
+    runs = []
+    with temp_database() as (db, queries):
+        recipients = [f"reader{i}@example.com" for i in range(args.recipients)]
+        for _ in range(2):
+            api = FakeHfApi(size, list_latency=args.list_latency, info_latency=args.info_latency,
+                            throttle_rate=args.throttle_rate)
+            postmark = FakePostmarkClient(latency=args.send_latency)
+            queries.reset()
+            timings = {}
+
+            start = time.perf_counter()
+            with timed(timings, 'fetch'):
+                projects = newsletter.fetch_trending_projects(
+                    db, api=api, max_workers=args.workers, limit=args.limit, window=size,
+                    repo_types=args.repo_types
+                )
+            with timed(timings, 'render'):
+                html_content = newsletter.create_email_content(projects, size)
+                text_content = newsletter.create_text_content(projects, size)
+            with timed(timings, 'deliver'):
+                edition_id = queue_edition(
+                    db, projects, recipients, newsletter.get_subject(size),
+                    html_content, text_content
+                )
+                delivery = drain_edition(db, edition_id, client=postmark)
+            total = time.perf_counter() - start
+
+            runs.append({
+                'total_seconds': total,
+                'stages': timings,
+                'db_queries': queries.count,
+                'api_calls': api.api_calls,
+                'featured': len(projects),
+                'messages_sent': delivery['sent'],
+                'messages_per_second': delivery['rate']
+            })
+    return runs
+
+def synthetic_projects(count):
+    api = FakeHfApi(count)
+    return [{
+        'title': model.modelId,
+        'author': model.author,
+        'description': f"Synthetic description of {model.modelId}",
+        'growth': "🆕 New to Top 500",
+        'likes': f"{model.likes} ❤️",
+        'link': f"https://huggingface.co/{model.modelId}",
+        'tags': model.tags,
+        'downloads': model.downloads,
+        'last_modified': model.lastModified,
+        'model_id': model.modelId
+    } for model in api.models]
+
+def bench_render(args):
+    """Render a large digest to measure the template on its own."""
+    projects = synthetic_projects(args.render_items)
+    start = time.perf_counter()
+    html_content = newsletter.create_email_content(projects, 500)
+    return {
+        'items': len(projects),
+        'seconds': time.perf_counter() - start,
+        'bytes': len(html_content.encode())
+    }
+
+def bench_segments(args):
+    """Build one variant per subscriber segment from shared cards.
+
+    Compared with rendering the full edition (HTML and text) once; the
+    variants should cost about that plus concatenation.
+    """
+    rng = random.Random(0)
+    projects = synthetic_projects(args.limit * 3)
+    authors = sorted({project['author'] for project in projects})
+    with temp_database() as (db, _):
+        for i in range(args.segments):
+            db.save_segment(f"segment{i}", rng.sample(TAGS, rng.randint(1, 3)),
+                            rng.sample(authors, rng.randint(0, 1)),
+                            rng.sample(authors, rng.randint(0, 1)))
+            db.add_subscriber(f"reader{i}@example.com", segment=f"segment{i}")
+        recipients = db.get_active_subscribers()
+
+        start = time.perf_counter()
+        newsletter.create_email_content(projects, 500)
+        newsletter.create_text_content(projects, 500)
+        full_render = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _, variants = newsletter.create_variants(db, projects, recipients, 500)
+        segmented = time.perf_counter() - start
+    return {
+        'segments': args.segments,
+        'variants': len(variants),
+        'full_render_seconds': full_render,
+        'variants_seconds': segmented
+    }
+
+def bench_prune(args):
+    """Record a daily history, applying the snapshot retention policy each day.
+    
+    Pruning runs on every fetch, so its cost must grow with the snapshots it
+    deletes, not with the history it keeps.
+    """
+    with temp_database() as (db, _):
+        seconds = record_history(db, days=args.prune_days, size=args.prune_size,
+                                 repo_types=('model',), prune=True)
+    return {
+        'days': args.prune_days,
+        'size': args.prune_size,
+        'total_seconds': sum(seconds),
+        'max_seconds': max(seconds)
+    }
+
+def bench_simulate(args):
+    """Replay a daily snapshot history over the default threshold grid."""
+    with temp_database() as (db, _):
+        record_history(db, days=args.history_days, repo_types=args.repo_types)
+        start = time.perf_counter()
+        results = run_simulation(db, DEFAULT_GRID, args.limit)
+        seconds = time.perf_counter() - start
+    return {
+        'days': args.history_days,
+        'combinations': len(results),
+        'seconds': seconds
+    }
+
+def run(args):
+    results = {
+        'meta': {
+            'commit': git_commit(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'args': vars(args)
+        },
+        'sizes': {},
+        'render': bench_render(args),
+        'segments': bench_segments(args),
+        'prune': bench_prune(args),
+        'simulate': bench_simulate(args)
+    }
+    for size in args.sizes:
+        print(f"Benchmarking {size} models...", file=sys.stderr)
+        first_run, daily_run = bench_end_to_end(size, args)
+        results['sizes'][str(size)] = {
+            'stages': bench_stages(size, args),
+            'first_run': first_run,
+            'daily_run': daily_run
+        }
+    return results
+
+def flatten(results):
+    """Flatten numeric results into {'path.to.metric': value} for comparison."""
+    flat = {}
+
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(f"{prefix}.{key}" if prefix else key, item)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix] = value
+
+    walk('', {'sizes': results['sizes'], 'render': results['render'],
+               'prune': results.get('prune', {}), 'simulate': results.get('simulate', {})})
+    return flat
+
+def compare(baseline, current):
+    """Print every metric side by side with its ratio to the baseline."""
+    old, new = flatten(baseline), flatten(current)
+    print(f"{'metric':60} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for key in sorted(set(old) & set(new)):
+        ratio = new[key] / old[key] if old[key] else float('nan')
+        print(f"{key:60} {old[key]:12.4g} {new[key]:12.4g} {ratio:8.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the newsletter pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 5000, 50000],
+                        help='Listing sizes to benchmark')
+    parser.add_argument('--limit', type=int, default=10, help='Models featured per edition')
+    parser.add_argument('--workers', type=int, default=8, help='Concurrent model info requests')
+    parser.add_argument('--repo-types', nargs='+', default=['model', 'dataset', 'space'],
+                        choices=['model', 'dataset', 'space'],
+                        help='Repo types fetched by the end-to-end runs (listed concurrently)')
+    parser.add_argument('--recipients', type=int, default=1000, help='Recipients per edition')
+    parser.add_argument('--list-latency', type=float, default=0.0,
+                        help='Seconds per listing page of 1000 models')
+    parser.add_argument('--info-latency', type=float, default=0.0,
+                        help='Seconds per model_info call')
+    parser.add_argument('--send-latency', type=float, default=0.0,
+                        help='Seconds per Postmark batch call')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='Fraction of model_info calls answered with HTTP 429 once')
+    parser.add_argument('--render-items', type=int, default=1000,
+                        help='Projects in the standalone render benchmark')
+    parser.add_argument('--segments', type=int, default=500,
+                        help='Subscriber segments in the segment variant benchmark')
+    parser.add_argument('--prune-days', type=int, default=90,
+                        help='Days of daily runs in the snapshot pruning benchmark')
+    parser.add_argument('--prune-size', type=int, default=5000,
+                        help='Models listed per run in the snapshot pruning benchmark')
+    parser.add_argument('--history-days', type=int, default=365,
+                        help='Days of snapshot history replayed by the threshold simulator')
+    parser.add_argument('--output', type=str, metavar='PATH',
+                        help='Where to write results (default: benchmarks/results/<commit>.json)')
+    parser.add_argument('--compare', type=str, metavar='PATH',
+                        help='Baseline results to compare against')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{results['meta']['commit'] or 'latest'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text()), results)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Check that the SQLite-only CLI commands start without the heavy imports.
+
+Runs `cli.py --stats` under `python -X importtime` from a throwaway copy of
+src/ and fails if any network or NumPy module is imported, or if the import
+time is not a small fraction of importing the full pipeline:
+
+    python benchmarks/startup.py
+"""
+import argparse
+import shutil
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+SRC_DIR = Path(__file__).resolve().parent.parent / 'src'
+
+# Modules only the fetch/send path may import
+HEAVY_MODULES = ['huggingface_hub', 'postmarker', 'dotenv', 'numpy', 'requests', 'webbrowser',
+                 'newsletter', 'cache', 'delivery', 'outbox', 'scoring']
+
+def import_times(args, cwd):
+    """Run python -X importtime and return {module: cumulative microseconds}.
+
+    Only top-level entries are kept, so nested imports are not counted twice;
+    the second return value is every module imported.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + args,
+        cwd=cwd, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed:\n{result.stderr}")
+    times, modules = {}, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        modules.add(name.strip())
+        if not name[1:].startswith(' '):
+            times[name.strip()] = int(cumulative)
+    return times, modules
+
+def best_of(runs, args, cwd):
+    """Total top-level import time of the fastest of several runs, with its modules."""
+    samples = [import_times(args, cwd) for _ in range(runs)]
+    times, modules = min(samples, key=lambda sample: sum(sample[0].values()))
+    return sum(times.values()), modules
+
+def main():
+    parser = argparse.ArgumentParser(description='Check CLI startup imports')
+    parser.add_argument('--runs', type=int, default=5, help='Runs per measurement (best is kept)')
+    parser.add_argument('--max-ratio', type=float, default=0.25,
+                        help='Highest allowed --stats import time relative to the full pipeline')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='hf_newsletter_startup_') as directory:
+        # cli.py creates data/ and logs/ next to src/, so run from a copy
+        src = Path(directory) / 'src'
+        shutil.copytree(SRC_DIR, src)
+        stats_us, stats_modules = best_of(args.runs, ['cli.py', '--stats'], src)
+        full_us, _ = best_of(args.runs, ['-c', 'import cli, newsletter, outbox, cache'], src)
+
+    loaded = {name.split('.')[0] for name in stats_modules}
+    heavy = sorted(loaded & set(HEAVY_MODULES))
+    ratio = stats_us / full_us if full_us else 0.0
+
+    print(f"--stats imports:       {stats_us / 1000:8.1f} ms")
+    print(f"full pipeline imports: {full_us / 1000:8.1f} ms")
+    print(f"ratio:                 {ratio:8.2f} (max {args.max_ratio:.2f})")
+
+    failed = False
+    if heavy:
+        print(f"FAIL: --stats imported {', '.join(heavy)}")
+        failed = True
+    if ratio > args.max_ratio:
+        print("FAIL: --stats startup regressed")
+        failed = True
+    if failed:
+        sys.exit(1)
+    print("OK")
+
+if __name__ == '__main__':
+    main()
@@ -4,10 +4,13 @@
 systemctl stop hf-newsletter.timer
 systemctl disable hf-newsletter.timer
 systemctl stop hf-newsletter.service
+systemctl stop hf-newsletter-daemon.service 2>/dev/null
+systemctl disable hf-newsletter-daemon.service 2>/dev/null
 
 # Remove systemd files
 rm /etc/systemd/system/hf-newsletter.service
 rm /etc/systemd/system/hf-newsletter.timer
+rm -f /etc/systemd/system/hf-newsletter-daemon.service
 
 # Reload systemd daemon
 systemctl daemon-reload
@@ -0,0 +1,273 @@
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+DEFAULT_LIST_TTL = 60 * 60  # Listings change quickly, keep them for an hour
+DEFAULT_CARD_TTL = 7 * 24 * 60 * 60  # Cards are keyed by revision, keep them for a week
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+DEFAULT_MEMORY_ENTRIES = 512  # Values a MemoryCache keeps unpickled
+
+# What the cache keeps of each listed repo: only the fields the newsletter
+# reads, so neither the cache nor a run holds on to full ModelInfo objects
+ListedRepo = namedtuple('ListedRepo', 'id author likes downloads last_modified tags sha')
+
+def listed_repo(repo):
+    """The ListedRepo of a listing entry."""
+    return ListedRepo(
+        getattr(repo, 'modelId', None) or repo.id,
+        getattr(repo, 'author', None),
+        getattr(repo, 'likes', None),
+        getattr(repo, 'downloads', None),
+        getattr(repo, 'lastModified', None) or getattr(repo, 'last_modified', None),
+        tuple(getattr(repo, 'tags', None) or ()),
+        getattr(repo, 'sha', None)
+    )
+
+class ResponseCache:
+    """Persistent key/value cache with per-entry TTLs and LRU eviction.
+
+    Values are pickled into a small SQLite database. When the total size of the
+    stored values exceeds max_bytes, the least recently used entries are evicted.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = str(path)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute('''
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    key TEXT PRIMARY KEY,
+                    value BLOB,
+                    size INTEGER,
+                    expires_at REAL,
+                    last_access REAL
+                )
+            ''')
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_last_access ON cache_entries (last_access)"
+            )
+
+    def get(self, key):
+        """Return (found, value) for key, ignoring expired entries."""
+        found, value, _ = self.get_entry(key)
+        return found, value
+
+    def get_entry(self, key):
+        """Like get(), also returning when the entry expires."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache_entries WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row is None or row[1] < now:
+                self.misses += 1
+                return False, None, None
+            with self._conn:
+                self._conn.execute(
+                    "UPDATE cache_entries SET last_access = ? WHERE key = ?",
+                    (now, key)
+                )
+            self.hits += 1
+        return True, pickle.loads(row[0]), row[1]
+
+    def set(self, key, value, ttl):
+        """Store value for ttl seconds. Returns False if it is larger than the whole cache."""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            # It would only evict everything else and then itself
+            return False
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute('''
+                INSERT OR REPLACE INTO cache_entries (key, value, size, expires_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (key, data, len(data), now + ttl, now))
+            self._evict(now)
+        return True
+
+    def _evict(self, now):
+        self._conn.execute("DELETE FROM cache_entries WHERE expires_at < ?", (now,))
+        total = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM cache_entries"
+        ).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Drop least recently used entries until we are back under budget
+        evicted = []
+        for key, size in self._conn.execute(
+            "SELECT key, size FROM cache_entries ORDER BY last_access"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM cache_entries WHERE key = ?", evicted)
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM cache_entries")
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries"
+            ).fetchone()
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': entries,
+            'bytes': size
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class MemoryCache:
+    """In-process LRU layer in front of a ResponseCache, for long-lived processes.
+
+    Values read or written are also kept unpickled in memory, up to
+    max_entries, so repeated lookups skip SQLite and unpickling. Entries
+    expire as they do on disk, and every set() still writes through to the
+    ResponseCache.
+    """
+
+    def __init__(self, backing, max_entries=DEFAULT_MEMORY_ENTRIES):
+        self.backing = backing
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (value, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return (found, value) for key, ignoring expired entries."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] >= now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[0]
+        found, value, expires_at = self.backing.get_entry(key)
+        with self._lock:
+            if found:
+                self.hits += 1
+                self._remember(key, value, expires_at)
+            else:
+                self._entries.pop(key, None)
+                self.misses += 1
+        return found, value
+
+    def set(self, key, value, ttl):
+        stored = self.backing.set(key, value, ttl)
+        with self._lock:
+            if stored:
+                self._remember(key, value, time.time() + ttl)
+            else:
+                self._entries.pop(key, None)
+        return stored
+
+    def _remember(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.backing.clear()
+
+    def stats(self):
+        with self._lock:
+            memory_entries = len(self._entries)
+        return {**self.backing.stats(), 'hits': self.hits, 'misses': self.misses,
+                'memory_entries': memory_entries}
+
+    def close(self):
+        with self._lock:
+            self._entries.clear()
+        self.backing.close()
+
+class CachedHfApi:
+    """Wraps an HfApi, caching the calls the newsletter makes.
+
+    Listings (models, datasets and Spaces) are cached per query for list_ttl
+    seconds, as ListedRepo tuples; listings larger than the cache are not
+    cached. Repo info is cached per revision (sha or last modification, as
+    seen in the last listing), so a card is refetched as soon as the repo
+    changes; cards without a known revision expire with the listing. Other
+    attributes pass straight through.
+    """
+
+    def __init__(self, api, cache, list_ttl=None, card_ttl=None):
+        self.api = api
+        self.cache = cache
+        self.list_ttl = list_ttl if list_ttl is not None else int(
+            os.getenv('HF_CACHE_LIST_TTL', DEFAULT_LIST_TTL))
+        self.card_ttl = card_ttl if card_ttl is not None else int(
+            os.getenv('HF_CACHE_CARD_TTL', DEFAULT_CARD_TTL))
+        # Revisions per (info method, repo id); the same id can name a model
+        # and a dataset
+        self._versions = {}
+
+    def __getattr__(self, name):
+        return getattr(self.api, name)
+
+    def list_models(self, **params):
+        return self._list('list_models', 'model_info', params)
+
+    def list_datasets(self, **params):
+        return self._list('list_datasets', 'dataset_info', params)
+
+    def list_spaces(self, **params):
+        return self._list('list_spaces', 'space_info', params)
+
+    def model_info(self, repo_id, **kwargs):
+        return self._info('model_info', repo_id, kwargs)
+
+    def dataset_info(self, repo_id, **kwargs):
+        return self._info('dataset_info', repo_id, kwargs)
+
+    def space_info(self, repo_id, **kwargs):
+        return self._info('space_info', repo_id, kwargs)
+
+    def _list(self, method, info_method, params):
+        key = f'{method}:' + json.dumps(params, sort_keys=True, default=str)
+        found, repos = self.cache.get(key)
+        if not found:
+            # Convert while listing, so the full entries are freed as we go
+            repos = [listed_repo(repo) for repo in getattr(self.api, method)(**params)]
+            self.cache.set(key, repos, self.list_ttl)
+
+        for repo in repos:
+            version = repo.sha or repo.last_modified
+            if version is not None:
+                self._versions[info_method, repo.id] = str(version)
+        return iter(repos)
+
+    def _info(self, method, repo_id, kwargs):
+        # Timeouts don't change the response, keep them out of the key
+        params = {k: v for k, v in kwargs.items() if k != 'timeout'}
+        version = self._versions.get((method, repo_id))
+        # Without a known revision (e.g. lean listings) we can't tell whether a
+        # cached card is stale, so only keep it as long as a listing
+        ttl = self.card_ttl if version is not None else self.list_ttl
+
+        key = f'{method}:' + json.dumps([repo_id, version, params], sort_keys=True, default=str)
+        found, info = self.cache.get(key)
+        if not found:
+            info = getattr(self.api, method)(repo_id, **kwargs)
+            self.cache.set(key, info, ttl)
+        return info
@@ -1,24 +1,42 @@
 import argparse
+import json
+import os
 from pathlib import Path
 from datetime import datetime
-import webbrowser
-import tempfile
 
-from newsletter import fetch_trending_projects, create_email_content, send_email
 from database import Database
 from logger import setup_logger
+from metrics import start_run
+from runner import run_newsletter, write_run_metrics
 # web_read function is provided by the environment
 
-def save_preview(html_content):
-    """Save HTML content to a temporary file and open in browser."""
-    with tempfile.NamedTemporaryFile('w', delete=False, suffix='.html') as f:
-        f.write(html_content)
-        return f.name
+# Only the send/preview path (runner.py) needs the Hugging Face, Postmark and
+# NumPy stacks, so those modules are imported inside the functions that use them.
+# --stats, --export and the subscriber commands start with just SQLite;
+# benchmarks/startup.py guards this.
 
-def display_statistics(db):
-    """Display database statistics in a formatted way."""
+def display_statistics(db, as_json=False):
+    """Display database statistics in a formatted way, or as JSON."""
     stats = db.get_statistics()
     
+    if as_json:
+        print(json.dumps({
+            'total_models': stats['total_models'],
+            'top_authors': [
+                {'author': author, 'models': count}
+                for author, count in stats['top_authors']
+            ],
+            'recent_highlights': [
+                {'model_id': model_id, 'author': author, 'last_highlighted': date}
+                for model_id, author, date in stats['recent_highlights']
+            ],
+            'most_liked': [
+                {'model_id': model_id, 'author': author, 'likes': likes}
+                for model_id, author, likes in stats['most_liked']
+            ]
+        }, indent=2))
+        return
+    
     print("\n=== Newsletter Database Statistics ===\n")
     print(f"Total models highlighted: {stats['total_models']}")
     
@@ -35,18 +53,168 @@ def display_statistics(db):
     for model_id, author, likes in stats['most_liked']:
         print(f"  - {model_id} by {author}: {likes} likes")
 
+def manage_subscribers(db, args, logger):
+    """Add, remove and list subscribers."""
+    if args.add_subscriber:
+        db.add_subscribers(((email, None) for email in args.add_subscriber), args.segment)
+        segment = f" to segment {args.segment}" if args.segment else ""
+        logger.info(f"Added {len(args.add_subscriber)} subscriber(s){segment}")
+    for email in args.remove_subscriber or []:
+        if db.remove_subscriber(email):
+            logger.info(f"Unsubscribed {email}")
+        else:
+            logger.info(f"{email} is not a subscriber")
+    if args.list_subscribers:
+        segments = db.get_subscriber_segments()
+        for email in db.get_active_subscribers():
+            print(f"{email}\t{segments[email]}" if email in segments else email)
+
+def manage_segments(db, args, logger):
+    """Add, remove and list subscriber segments."""
+    if args.add_segment:
+        db.save_segment(args.add_segment, args.tags or [], args.authors or [],
+                        args.exclude_authors or [])
+        logger.info(f"Saved segment {args.add_segment}")
+    if args.remove_segment:
+        moved = db.remove_segment(args.remove_segment)
+        if moved is None:
+            logger.info(f"{args.remove_segment} is not a segment")
+        else:
+            logger.info(f"Removed segment {args.remove_segment}; "
+                        f"{moved} subscriber(s) now get the full edition")
+    if args.list_segments:
+        for name, segment in db.get_segments().items():
+            filters = [
+                f"{label}: {', '.join(segment[key])}"
+                for key, label in (('tags', 'tags'), ('authors', 'authors'),
+                                   ('exclude_authors', 'excluding'))
+                if segment[key]
+            ]
+            print(f"{name}\t{'; '.join(filters) or 'everything'}")
+
+def export_database(db, args, logger):
+    """Export highlights or snapshot history to a file."""
+    from export import export_table
+    export_path = Path(args.export)
+    count = export_table(db, export_path, args.format, args.table, args.since)
+    logger.info(f"Exported {count} {args.table} rows to {export_path}")
+
+def simulate_thresholds(db, args, logger):
+    """Replay the snapshot history over a grid of featuring thresholds."""
+    import sys
+    import time
+    from simulate import parse_grid, production_result, run_simulation, write_results
+    grid = parse_grid(args.grid)
+    limit = args.limit or int(os.getenv('NEWSLETTER_LIMIT', 0)) or None
+    start = time.perf_counter()
+    results = run_simulation(db, grid, limit, args.since, args.repo_types)
+    elapsed = time.perf_counter() - start
+    if args.simulate == '-':
+        write_results(results, sys.stdout)
+    else:
+        with open(args.simulate, 'w', newline='') as f:
+            write_results(results, f)
+    logger.info(f"Simulated {len(results)} threshold combinations in {elapsed:.2f}s")
+    
+    current = production_result(results)
+    if current:
+        logger.info(
+            f"Current thresholds: {current['featured_mean']:.1f} repos per edition "
+            f"({current['featured_min']:.0f}-{current['featured_max']:.0f}), "
+            f"{current['empty_fraction']:.0%} of {current['editions']:.0f} editions empty"
+        )
+
+def write_profile(profiler, logs_path, logger):
+    """Save cProfile stats under logs/ and print the top entries."""
+    import pstats
+    profile_path = logs_path / f"profile_{datetime.now().strftime('%Y%m%dT%H%M%S')}.pstats"
+    profiler.dump_stats(profile_path)
+    pstats.Stats(profiler).sort_stats('cumulative').print_stats(20)
+    logger.info(f"Profile saved to {profile_path}")
+
 def main():
     parser = argparse.ArgumentParser(description='Hugging Face Newsletter Generator')
     parser.add_argument('--preview', action='store_true',
                       help='Generate newsletter and open in browser without sending')
     parser.add_argument('--stats', action='store_true',
                       help='Display database statistics')
+    parser.add_argument('--json', action='store_true',
+                      help='Print --stats as JSON, e.g. for dashboards')
     parser.add_argument('--export', type=str, metavar='PATH',
-                      help='Export database to CSV file')
+                      help='Export database to a CSV, JSONL or Parquet file')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'parquet'],
+                      help='Export format (default: from the file extension, else CSV)')
+    parser.add_argument('--table', choices=['highlights', 'snapshots'], default='highlights',
+                      help='What to export: highlighted models or the snapshot history')
+    parser.add_argument('--since', type=datetime.fromisoformat, metavar='DATE',
+                      help='Export or simulate only rows recorded on or after DATE (YYYY-MM-DD)')
     parser.add_argument('--recipient', type=str,
                       help='Override recipient email from .env file')
+    parser.add_argument('--add-subscriber', type=str, action='append', metavar='EMAIL',
+                      help='Add a subscriber (can be repeated)')
+    parser.add_argument('--remove-subscriber', type=str, action='append', metavar='EMAIL',
+                      help='Unsubscribe an email address (can be repeated)')
+    parser.add_argument('--list-subscribers', action='store_true',
+                      help='List active subscribers')
+    parser.add_argument('--segment', type=str, metavar='NAME',
+                      help='Segment for the subscribers added with --add-subscriber')
+    parser.add_argument('--add-segment', type=str, metavar='NAME',
+                      help='Create or replace a segment, filtered by --tags, --authors and --exclude-authors')
+    parser.add_argument('--tags', nargs='+', metavar='TAG',
+                      help='Segment gets only repos with one of these tags, e.g. text-generation')
+    parser.add_argument('--authors', nargs='+', metavar='AUTHOR',
+                      help='Segment gets only repos by these authors')
+    parser.add_argument('--exclude-authors', nargs='+', metavar='AUTHOR',
+                      help='Segment never gets repos by these authors')
+    parser.add_argument('--remove-segment', type=str, metavar='NAME',
+                      help='Delete a segment; its subscribers get the full edition again')
+    parser.add_argument('--list-segments', action='store_true',
+                      help='List segments and their filters')
+    parser.add_argument('--send-concurrency', type=int, metavar='N',
+                      help='Number of concurrent Postmark batch calls (default: POSTMARK_CONCURRENCY or 4)')
+    parser.add_argument('--resend-unconfirmed', action='store_true',
+                      help='Requeue messages whose delivery was never confirmed (may send duplicates)')
+    parser.add_argument('--no-resume', action='store_true',
+                      help='Start a fresh run instead of resuming an interrupted one')
+    parser.add_argument('--workers', type=int, metavar='N',
+                      help='Number of concurrent info requests per repo type (default: HF_MAX_WORKERS or 8)')
+    parser.add_argument('--limit', type=int, metavar='N',
+                      help='Maximum number of repos to feature per repo type (default: NEWSLETTER_LIMIT or 10)')
+    parser.add_argument('--window', type=int, metavar='N',
+                      help='Number of most popular repos of each type to scan (default: HF_WINDOW or 500)')
+    parser.add_argument('--repo-types', nargs='+', choices=['model', 'dataset', 'space'],
+                      metavar='TYPE',
+                      help='Repo types to feature: model, dataset, space (default: HF_REPO_TYPES or all three)')
+    parser.add_argument('--lean', action='store_true',
+                      help='Fetch only the fields needed for scoring, for large windows')
+    parser.add_argument('--no-cache', action='store_true',
+                      help='Bypass the on-disk Hugging Face response cache')
+    parser.add_argument('--wal', action='store_true',
+                      help='Use WAL journaling so reads can run alongside a send')
+    parser.add_argument('--log-json', action='store_true',
+                      help='Write the log file as JSON lines with run id and stage (default: LOG_FORMAT)')
+    parser.add_argument('--daemon', action='store_true',
+                      help='Stay running and send editions on a schedule')
+    parser.add_argument('--schedule', type=str, action='append', metavar='SPEC',
+                      help='Daemon schedule as name=cron, e.g. "weekly=0 9 * * mon limit=20" '
+                           '(can be repeated; default: NEWSLETTER_SCHEDULE or daily at 9:00)')
+    parser.add_argument('--health-port', type=int, metavar='PORT',
+                      help='Localhost port of the daemon health endpoint, 0 to disable '
+                           '(default: NEWSLETTER_HEALTH_PORT or 8787)')
+    parser.add_argument('--simulate', nargs='?', const='-', metavar='PATH',
+                      help='Replay the snapshot history over a grid of featuring thresholds and '
+                           'write one CSV row per combination to PATH (default: stdout)')
+    parser.add_argument('--grid', type=str, action='append', metavar='NAME=VALUES',
+                      help='Threshold values to simulate, e.g. cooldown_days=7,14 or '
+                           'weekly_likes_growth=0.1:0.5:0.05 (can be repeated)')
+    parser.add_argument('--profile', action='store_true',
+                      help='Profile the run with cProfile and save the stats under logs/')
     
     args = parser.parse_args()
+    if args.daemon and args.preview:
+        parser.error('--preview cannot be combined with --daemon')
+    if args.grid and not args.simulate:
+        parser.error('--grid requires --simulate')
     
     # Setup paths
     base_path = Path(__file__).parent.parent
@@ -55,52 +223,53 @@ def main():
     data_path.mkdir(exist_ok=True)
     
     # Setup logger
-    logger = setup_logger(logs_path)
+    logger = setup_logger(logs_path, json_format=args.log_json or None)
     
     # Initialize database
-    db = Database(data_path / "newsletter.db")
+    db = Database(data_path / "newsletter.db", wal=args.wal)
+    run_metrics = None
+    success = False
+    
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
     
     try:
         if args.stats:
-            display_statistics(db)
-            return
-            
-        if args.export:
-            export_path = Path(args.export)
-            db.export_to_csv(export_path)
-            logger.info(f"Database exported to {export_path}")
-            return
-        
-        # Fetch projects
-        logger.info("Fetching trending projects...")
-        projects = fetch_trending_projects(db)
-        
-        if not projects:
-            logger.info("No new or updated projects found")
-            return
-        
-        logger.info(f"Found {len(projects)} new or updated projects")
-        
-        # Create newsletter content
-        logger.info("Creating email content...")
-        html_content = create_email_content(projects)
-        
-        if args.preview:
-            preview_path = save_preview(html_content)
-            logger.info(f"Opening preview in browser...")
-            webbrowser.open(f'file://{preview_path}')
-            return
-        
-        # Send newsletter
-        logger.info("Sending email...")
-        recipient = args.recipient
-        send_email(recipient, html_content)
-        
-        logger.info("Newsletter sent successfully!")
+            display_statistics(db, args.json)
+        elif args.add_segment or args.remove_segment or args.list_segments:
+            manage_segments(db, args, logger)
+        elif args.add_subscriber or args.remove_subscriber or args.list_subscribers:
+            manage_subscribers(db, args, logger)
+        elif args.export:
+            export_database(db, args, logger)
+        elif args.simulate:
+            simulate_thresholds(db, args, logger)
+        elif args.daemon:
+            # Each scheduled edition records its own run metrics
+            from daemon import run_daemon
+            run_daemon(db, args, data_path, logs_path)
+        else:
+            # Fetch/send runs are instrumented; the maintenance commands are not
+            run_metrics = start_run()
+            success = run_newsletter(db, args, logger, run_metrics, data_path)
     
     except Exception as e:
         logger.error(f"An error occurred: {str(e)}")
         raise
+    
+    finally:
+        db.close()
+        
+        if run_metrics is not None:
+            run_metrics.finish(success)
+            write_run_metrics(run_metrics, logs_path, logger)
+        
+        if profiler is not None:
+            profiler.disable()
+            write_profile(profiler, logs_path, logger)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
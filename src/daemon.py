@@ -0,0 +1,354 @@
+import copy
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cache import MemoryCache
+from metrics import start_run
+from newsletter import DEFAULT_MAX_WORKERS, REPO_TYPES, create_api
+from runner import open_cache, run_newsletter, write_run_metrics
+
+logger = logging.getLogger('hf_newsletter')
+
+DEFAULT_SCHEDULE = 'daily=0 9 * * *'
+DEFAULT_HEALTH_PORT = 8787
+MAX_SLEEP = 60  # Re-read the clock at least this often, e.g. after a suspend
+
+# (name, lowest, highest) of each cron field; 7 is also Sunday
+CRON_FIELDS = (
+    ('minute', 0, 59),
+    ('hour', 0, 23),
+    ('day', 1, 31),
+    ('month', 1, 12),
+    ('weekday', 0, 7)
+)
+CRON_NAMES = {
+    'month': ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'],
+    'weekday': ['sun', 'mon', 'tue', 'wed', 'thu', 'fri', 'sat']
+}
+CRON_ALIASES = {
+    '@hourly': '0 * * * *',
+    '@daily': '0 0 * * *',
+    '@weekly': '0 0 * * 0',
+    '@monthly': '0 0 1 * *'
+}
+
+def _repo_types(value):
+    repo_types = value.split(',')
+    unknown = [name for name in repo_types if name not in REPO_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown repo type(s): {', '.join(unknown)}")
+    return repo_types
+
+# Run options a schedule can override, and how to parse them
+SCHEDULE_OPTIONS = {
+    'limit': int,
+    'window': int,
+    'repo_types': _repo_types,
+    'lean': lambda value: value.lower() in ('1', 'true', 'yes')
+}
+
+def _cron_value(text, name, low):
+    names = CRON_NAMES.get(name)
+    if names and text in names:
+        return names.index(text) + low
+    try:
+        return int(text)
+    except ValueError:
+        raise ValueError(f"Invalid {name} in cron expression: {text!r}")
+
+def _parse_field(field, name, low, high):
+    """Set of values matched by one cron field (*, lists, ranges, steps)."""
+    values = set()
+    for part in field.lower().split(','):
+        part, _, step = part.partition('/')
+        if part == '*':
+            start, end = low, high
+        else:
+            start, _, end = part.partition('-')
+            start = _cron_value(start, name, low)
+            end = _cron_value(end, name, low) if end else (high if step else start)
+        step = _cron_value(step, 'step', 0) if step else 1
+        if not low <= start <= end <= high or step < 1:
+            raise ValueError(f"Invalid {name} in cron expression: {field!r}")
+        values.update(range(start, end + 1, step))
+    if name == 'weekday' and 7 in values:
+        values.discard(7)
+        values.add(0)
+    return frozenset(values)
+
+class CronSchedule:
+    """A five-field cron expression: minute hour day month weekday.
+    
+    Fields take *, lists, ranges and steps (*/15, 1-5, mon-fri), and months
+    and weekdays can be named. As in cron, when both day and weekday are
+    restricted a time matches either one. Times are local.
+    """
+    
+    def __init__(self, expression):
+        self.expression = expression.strip()
+        fields = CRON_ALIASES.get(self.expression, self.expression).split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            _parse_field(field, *spec) for field, spec in zip(fields, CRON_FIELDS)
+        )
+        self._any_day = fields[2].startswith('*')
+        self._any_weekday = fields[4].startswith('*')
+        # Fail now for dates that never come, e.g. 30 February
+        self.next_after(datetime.now())
+    
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return day and weekday
+        return day or weekday
+    
+    def next_after(self, moment):
+        """First matching minute after moment."""
+        moment = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        last_year = moment.year + 5
+        while moment.year <= last_year:
+            if moment.month not in self.months:
+                moment = (moment.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(moment):
+                moment = moment.replace(hour=0, minute=0) + timedelta(days=1)
+            elif moment.hour not in self.hours:
+                moment = moment.replace(minute=0) + timedelta(hours=1)
+            elif moment.minute not in self.minutes:
+                moment += timedelta(minutes=1)
+            else:
+                return moment
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+def parse_schedule(spec):
+    """Parse 'name=cron [option=value ...]', e.g. 'weekly=0 9 * * mon limit=20'."""
+    name, sep, rest = spec.partition('=')
+    name = name.strip()
+    if not sep or not name:
+        raise ValueError(f"Schedule needs a name, e.g. daily=0 9 * * *: {spec!r}")
+    tokens = rest.split()
+    options = {}
+    while tokens and '=' in tokens[-1]:
+        key, _, value = tokens.pop().partition('=')
+        key = key.replace('-', '_')
+        if key not in SCHEDULE_OPTIONS:
+            raise ValueError(f"Unknown schedule option {key!r} in {spec!r}")
+        options[key] = SCHEDULE_OPTIONS[key](value)
+    return {'name': name, 'cron': CronSchedule(' '.join(tokens)), 'options': options}
+
+def get_schedules(specs=None):
+    """Schedules from --schedule, else NEWSLETTER_SCHEDULE (separated by ';').
+    
+    Defaults to one daily edition at 9:00, like the systemd timer.
+    """
+    if not specs:
+        specs = [spec for spec in os.getenv('NEWSLETTER_SCHEDULE', DEFAULT_SCHEDULE).split(';')
+                 if spec.strip()]
+    schedules = [parse_schedule(spec) for spec in specs]
+    names = [schedule['name'] for schedule in schedules]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Duplicate schedule names: {', '.join(names)}")
+    return schedules
+
+def share_connection_pool(pool_size):
+    """Send every huggingface_hub request through one HTTP connection pool.
+    
+    huggingface_hub opens a Session per thread, and the worker threads are new
+    for every run, so each edition would otherwise start with cold TLS
+    connections. Mounting one adapter on all sessions keeps them alive.
+    """
+    import requests
+    from huggingface_hub import configure_http_backend
+    
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=pool_size)
+    
+    def backend_factory():
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+    
+    configure_http_backend(backend_factory=backend_factory)
+
+class _HealthHandler(BaseHTTPRequestHandler):
+    """GET /health (200 or 503) and GET /status (schedule details)."""
+    
+    def do_GET(self):
+        owner = self.server.owner
+        if self.path == '/health':
+            healthy = owner.healthy()
+            code, body = (200 if healthy else 503), {'status': 'ok' if healthy else 'unhealthy'}
+        elif self.path == '/status':
+            code, body = 200, owner.status()
+        else:
+            code, body = 404, {'error': 'not found'}
+        data = json.dumps(body, indent=2).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+    
+    def log_message(self, format, *args):
+        logger.debug(f"Health endpoint: {format % args}")
+
+class Daemon:
+    """Runs scheduled editions in one long-lived process.
+    
+    The database, the Hugging Face client with its response cache (with an
+    in-memory layer) and connection pool, and the Postmark client stay open
+    between editions.
+    SIGTERM or SIGINT stops the scheduler once the edition in progress (if
+    any) has finished; a killed run resumes from its checkpoint.
+    """
+    
+    def __init__(self, db, args, schedules, data_path, logs_path, health_port=DEFAULT_HEALTH_PORT):
+        self.db = db
+        self.args = args
+        self.schedules = schedules
+        self.data_path = data_path
+        self.logs_path = logs_path
+        self.health_port = health_port
+        self.api = None
+        self.current = None
+        self.started_at = time.time()
+        self._cache = None
+        self._server = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        now = datetime.now()
+        for schedule in schedules:
+            schedule.update(next_run=schedule['cron'].next_after(now), last_run=None,
+                            last_status=None, last_duration=None, runs=0, failures=0)
+    
+    def run(self):
+        """Run editions as they come due until stop() is called."""
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self.stop)
+        self._open_clients()
+        self._start_health_server()
+        for schedule in self.schedules:
+            logger.info(f"Next {schedule['name']} edition at {schedule['next_run']:%Y-%m-%d %H:%M}")
+        try:
+            while not self._stop.is_set():
+                for schedule in self.schedules:
+                    if self._stop.is_set():
+                        break
+                    if schedule['next_run'] <= datetime.now():
+                        self.run_edition(schedule)
+                wait = min(schedule['next_run'] for schedule in self.schedules) - datetime.now()
+                self._stop.wait(min(max(wait.total_seconds(), 0), MAX_SLEEP))
+        finally:
+            self.close()
+        logger.info("Daemon stopped")
+    
+    def run_edition(self, schedule):
+        """Run one edition with the schedule's options; failures are logged, not raised."""
+        args = copy.copy(self.args)
+        for key, value in schedule['options'].items():
+            setattr(args, key, value)
+        with self._lock:
+            self.current = schedule['name']
+        logger.info(f"Starting {schedule['name']} edition")
+        run_metrics = start_run(f"{datetime.now():%Y%m%dT%H%M%S}-{schedule['name']}")
+        success = False
+        try:
+            success = run_newsletter(self.db, args, logger, run_metrics, self.data_path, api=self.api)
+        except Exception as e:
+            logger.exception(f"{schedule['name']} edition failed: {str(e)}")
+        finally:
+            run_metrics.finish(success)
+            write_run_metrics(run_metrics, self.logs_path, logger)
+            # The run's worker threads are gone; close their connections
+            self.db.close_idle()
+            with self._lock:
+                self.current = None
+                schedule['runs'] += 1
+                schedule['failures'] += 0 if success else 1
+                schedule['last_run'] = datetime.fromtimestamp(run_metrics.started_at)
+                schedule['last_status'] = 'ok' if success else 'failed'
+                schedule['last_duration'] = run_metrics.finished_at - run_metrics.started_at
+                # Editions missed while this one ran are skipped, as cron does
+                schedule['next_run'] = schedule['cron'].next_after(datetime.now())
+        logger.info(f"Next {schedule['name']} edition at {schedule['next_run']:%Y-%m-%d %H:%M}")
+        return success
+    
+    def stop(self, signum=None, frame=None):
+        if signum is not None:
+            logger.info(f"Received {signal.Signals(signum).name}, stopping after the current edition")
+        self._stop.set()
+    
+    def healthy(self):
+        """Running, and the last edition of every schedule succeeded."""
+        with self._lock:
+            return not self._stop.is_set() and all(
+                schedule['last_status'] != 'failed' for schedule in self.schedules
+            )
+    
+    def status(self):
+        def isoformat(moment):
+            return moment.isoformat() if moment is not None else None
+        
+        with self._lock:
+            return {
+                'status': 'stopping' if self._stop.is_set() else 'running',
+                'started_at': datetime.fromtimestamp(self.started_at).isoformat(),
+                'uptime_seconds': round(time.time() - self.started_at, 1),
+                'current_edition': self.current,
+                'schedules': [
+                    {
+                        'name': schedule['name'],
+                        'cron': schedule['cron'].expression,
+                        'options': schedule['options'],
+                        'next_run': isoformat(schedule['next_run']),
+                        'last_run': isoformat(schedule['last_run']),
+                        'last_status': schedule['last_status'],
+                        'last_duration_seconds': schedule['last_duration'],
+                        'runs': schedule['runs'],
+                        'failures': schedule['failures']
+                    }
+                    for schedule in self.schedules
+                ]
+            }
+    
+    def _open_clients(self):
+        workers = self.args.workers or int(os.getenv('HF_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+        # One fetch thread per repo type, each with its own enrichment workers
+        share_connection_pool(len(REPO_TYPES) * (workers + 1))
+        # Cards are looked up again by every edition; keep them in memory too
+        self._cache = None if self.args.no_cache else MemoryCache(open_cache(self.data_path))
+        self.api = create_api(self._cache)
+    
+    def _start_health_server(self):
+        if not self.health_port:
+            return
+        self._server = ThreadingHTTPServer(('127.0.0.1', self.health_port), _HealthHandler)
+        self._server.daemon_threads = True
+        self._server.owner = self
+        threading.Thread(target=self._server.serve_forever, name='health', daemon=True).start()
+        logger.info(f"Health endpoint on http://127.0.0.1:{self.health_port}/health")
+    
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+def run_daemon(db, args, data_path, logs_path):
+    """Run the scheduler in the foreground until SIGTERM or SIGINT."""
+    schedules = get_schedules(args.schedule)
+    health_port = args.health_port
+    if health_port is None:
+        health_port = int(os.getenv('NEWSLETTER_HEALTH_PORT', DEFAULT_HEALTH_PORT))
+    daemon = Daemon(db, args, schedules, data_path, logs_path, health_port)
+    daemon.run()
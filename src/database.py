@@ -1,14 +1,178 @@
+import json
 import sqlite3
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
 
+from metrics import get_metrics
+
+# Stay below SQLite's default limit on bound parameters per statement
+MAX_QUERY_PARAMS = 900
+
+# Memory-map up to 256 MB of the database file when tuning is enabled
+DEFAULT_MMAP_SIZE = 256 * 1024 * 1024
+
+DAY_SECONDS = 24 * 60 * 60
+WEEK_SECONDS = 7 * DAY_SECONDS
+
+# Snapshots older than this are downsampled to one per model per week
+FULL_RESOLUTION_DAYS = 30
+
+# Interrupted runs older than this start over instead of resuming
+RUN_MAX_AGE = 12 * 60 * 60
+
+# Checkpoint stages of a run, in order
+RUN_STAGES = ('started', 'listed', 'scored', 'enriched', 'rendered', 'sent')
+
+# Rows fetched from the cursor at a time when exporting
+EXPORT_CHUNK_SIZE = 5000
+
+# Exportable tables: SQL table, (column, type) pairs, the column --since
+# filters on, and the export order
+EXPORT_TABLES = {
+    'highlights': (
+        'highlighted_models',
+        [('model_id', 'text'), ('author', 'text'), ('last_highlighted', 'text'),
+         ('last_modified', 'text'), ('likes', 'integer'), ('downloads', 'integer'),
+         ('repo_type', 'text')],
+        'last_highlighted',
+        'model_id'
+    ),
+    'snapshots': (
+        'model_snapshots',
+        [('model_id', 'text'), ('ts', 'integer'), ('likes', 'integer'),
+         ('downloads', 'integer'), ('rank', 'integer'), ('repo_type', 'text')],
+        'ts',
+        'model_id, ts'
+    )
+}
+
+class _Cursor(sqlite3.Cursor):
+    """Reports each execute(), executemany() and executescript() call once."""
+    
+    def execute(self, sql, parameters=()):
+        self.connection.on_statement(sql)
+        return super().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        self.connection.on_statement(sql)
+        return super().executemany(sql, seq_of_parameters)
+    
+    def executescript(self, sql_script):
+        self.connection.on_statement(sql_script)
+        return super().executescript(sql_script)
+
+class _Connection(sqlite3.Connection):
+    """A connection whose statements go through _Cursor.
+    
+    SQLite's trace callback fires for every row of an executemany(), so it
+    counts rows rather than round trips; counting the calls shows batching.
+    """
+    
+    on_statement = staticmethod(lambda sql: None)
+    
+    def cursor(self, factory=_Cursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+    
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
 class Database:
-    def __init__(self, db_path="newsletter.db"):
-        self.db_path = db_path
+    """SQLite store for highlighted models.
+    
+    Each thread gets its own long-lived connection, so the object can be shared
+    with worker threads. Pass wal=True to switch the database to WAL journaling
+    with synchronous=NORMAL and memory-mapped reads, which lets readers such as
+    --stats run while a send is writing.
+    """
+    
+    def __init__(self, db_path="newsletter.db", wal=False, mmap_size=DEFAULT_MMAP_SIZE,
+                 timeout=30.0):
+        self.db_path = str(db_path)
+        self.wal = wal
+        self.mmap_size = mmap_size
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+        self._trace_callback = None
+        self._run_lock = threading.Lock()
         self._init_db()
     
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _connect(self):
+        """Return this thread's connection, opening it on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                timeout=self.timeout,
+                check_same_thread=False,
+                cached_statements=256,
+                factory=_Connection
+            )
+            if self.wal:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+                conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append((threading.current_thread(), conn))
+            conn.on_statement = self._trace
+        return conn
+    
+    def _trace(self, statement):
+        get_metrics().incr('db_statements')
+        callback = self._trace_callback
+        if callback is not None:
+            callback(statement)
+    
+    def set_trace_callback(self, callback):
+        """Call callback with the SQL of every statement run on any connection.
+        
+        A statement is one execute(), executemany() or executescript() call,
+        so a batch counts once however many rows it writes. The same count is
+        recorded as the db_statements run metric.
+        """
+        self._trace_callback = callback
+    
+    def close(self):
+        """Close every connection opened by this object."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for _, conn in connections:
+            conn.close()
+        self._local = threading.local()
+    
+    def close_idle(self):
+        """Close the connections of threads that have exited.
+        
+        Worker pools are created per run, so a long-running process calls this
+        between runs to keep their connections from piling up.
+        """
+        with self._lock:
+            idle = [conn for thread, conn in self._connections if not thread.is_alive()]
+            self._connections = [
+                (thread, conn) for thread, conn in self._connections if thread.is_alive()
+            ]
+        for conn in idle:
+            conn.close()
+        return len(idle)
+    
     def _init_db(self):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS highlighted_models (
@@ -20,10 +184,209 @@ class Database:
                     downloads INTEGER
                 )
             ''')
+            # One row per model per run; ts is a unix timestamp so window
+            # functions can use numeric RANGE frames
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS model_snapshots (
+                    model_id TEXT NOT NULL,
+                    ts INTEGER NOT NULL,
+                    likes INTEGER,
+                    downloads INTEGER,
+                    rank INTEGER,
+                    PRIMARY KEY (model_id, ts)
+                ) WITHOUT ROWID
+            ''')
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_model_snapshots_ts ON model_snapshots (ts)"
+            )
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS subscribers (
+                    email TEXT PRIMARY KEY,
+                    name TEXT,
+                    subscribed_at TIMESTAMP,
+                    active INTEGER NOT NULL DEFAULT 1
+                )
+            ''')
+            # Rendered editions and their per-recipient delivery state. Highlights
+            # are stored with the edition and only committed once it is delivered.
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS editions (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TIMESTAMP,
+                    subject TEXT,
+                    html TEXT,
+                    text TEXT,
+                    highlights TEXT,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    completed_at TIMESTAMP
+                )
+            ''')
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS outbox (
+                    edition_id INTEGER NOT NULL REFERENCES editions (id),
+                    recipient TEXT NOT NULL,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    message_id TEXT,
+                    error TEXT,
+                    updated_at TIMESTAMP,
+                    PRIMARY KEY (edition_id, recipient)
+                )
+            ''')
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS idx_outbox_status ON outbox (edition_id, status)"
+            )
+            # Checkpoints of fetch/send runs, so an interrupted run can resume
+            # from its last completed stage. The listing and scored selection
+            # are kept as JSON until the run finishes.
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS runs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    started_at TIMESTAMP,
+                    started_ts INTEGER NOT NULL,
+                    updated_at TIMESTAMP,
+                    params TEXT,
+                    stage TEXT NOT NULL DEFAULT 'started',
+                    status TEXT NOT NULL DEFAULT 'running',
+                    listing TEXT,
+                    selected TEXT,
+                    edition_id INTEGER REFERENCES editions (id)
+                )
+            ''')
+            cursor.execute("CREATE INDEX IF NOT EXISTS idx_runs_status ON runs (status)")
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS run_enrichment (
+                    run_id INTEGER NOT NULL REFERENCES runs (id),
+                    model_id TEXT NOT NULL,
+                    details TEXT,
+                    PRIMARY KEY (run_id, model_id)
+                ) WITHOUT ROWID
+            ''')
+            # Subscriber segments: JSON lists of tags and authors to include
+            # or exclude; an empty list does not filter
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS segments (
+                    name TEXT PRIMARY KEY,
+                    tags TEXT,
+                    authors TEXT,
+                    exclude_authors TEXT
+                )
+            ''')
+            # Per-segment renderings of an edition. Outbox rows with variant 0
+            # get the edition's own html/text.
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS edition_variants (
+                    edition_id INTEGER NOT NULL REFERENCES editions (id),
+                    variant INTEGER NOT NULL,
+                    segments TEXT,
+                    html TEXT,
+                    text TEXT,
+                    PRIMARY KEY (edition_id, variant)
+                ) WITHOUT ROWID
+            ''')
+            self._add_repo_type(cursor)
+            self._add_segments(cursor)
+            self._init_statistics(cursor)
             conn.commit()
     
+    def _add_repo_type(self, cursor):
+        """Add the repo_type column to databases created before datasets and
+        Spaces were tracked. Their rows are all models."""
+        for table in ('highlighted_models', 'model_snapshots'):
+            columns = [row[1] for row in cursor.execute(f"PRAGMA table_info({table})")]
+            if 'repo_type' not in columns:
+                cursor.execute(
+                    f"ALTER TABLE {table} ADD COLUMN repo_type TEXT NOT NULL DEFAULT 'model'"
+                )
+    
+    def _add_segments(self, cursor):
+        """Add the subscriber segment and outbox variant columns to databases
+        created before segments existed."""
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(subscribers)")]
+        if 'segment' not in columns:
+            cursor.execute("ALTER TABLE subscribers ADD COLUMN segment TEXT REFERENCES segments (name)")
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(outbox)")]
+        if 'variant' not in columns:
+            cursor.execute("ALTER TABLE outbox ADD COLUMN variant INTEGER NOT NULL DEFAULT 0")
+    
+    def _init_statistics(self, cursor):
+        """Indexes and trigger-maintained summary tables behind --stats."""
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_highlighted_models_author ON highlighted_models (author)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_highlighted_models_last_highlighted "
+            "ON highlighted_models (last_highlighted)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_highlighted_models_likes ON highlighted_models (likes)"
+        )
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS author_counts (
+                author TEXT PRIMARY KEY,
+                models INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS idx_author_counts_models ON author_counts (models)"
+        )
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stats_summary (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                total_models INTEGER NOT NULL
+            )
+        ''')
+        
+        # The triggers run inside whatever transaction writes highlighted_models,
+        # so the summary cannot drift from the table. Unknown authors are
+        # counted under ''.
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS highlighted_models_insert
+            AFTER INSERT ON highlighted_models
+            BEGIN
+                INSERT INTO author_counts (author, models) VALUES (COALESCE(NEW.author, ''), 1)
+                ON CONFLICT (author) DO UPDATE SET models = models + 1;
+                UPDATE stats_summary SET total_models = total_models + 1 WHERE id = 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS highlighted_models_delete
+            AFTER DELETE ON highlighted_models
+            BEGIN
+                UPDATE author_counts SET models = models - 1 WHERE author = COALESCE(OLD.author, '');
+                DELETE FROM author_counts WHERE author = COALESCE(OLD.author, '') AND models <= 0;
+                UPDATE stats_summary SET total_models = total_models - 1 WHERE id = 1;
+            END
+        ''')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS highlighted_models_author_update
+            AFTER UPDATE OF author ON highlighted_models
+            WHEN COALESCE(OLD.author, '') != COALESCE(NEW.author, '')
+            BEGIN
+                UPDATE author_counts SET models = models - 1 WHERE author = COALESCE(OLD.author, '');
+                DELETE FROM author_counts WHERE author = COALESCE(OLD.author, '') AND models <= 0;
+                INSERT INTO author_counts (author, models) VALUES (COALESCE(NEW.author, ''), 1)
+                ON CONFLICT (author) DO UPDATE SET models = models + 1;
+            END
+        ''')
+        
+        # Backfill once for databases created before the summary existed
+        cursor.execute("SELECT 1 FROM stats_summary WHERE id = 1")
+        if cursor.fetchone() is None:
+            cursor.execute("DELETE FROM author_counts")
+            cursor.execute('''
+                INSERT INTO author_counts (author, models)
+                SELECT COALESCE(author, ''), COUNT(*) FROM highlighted_models
+                GROUP BY COALESCE(author, '')
+            ''')
+            cursor.execute(
+                "INSERT INTO stats_summary (id, total_models) "
+                "SELECT 1, COUNT(*) FROM highlighted_models"
+            )
+    
     def get_highlighted_model(self, model_id):
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "SELECT * FROM highlighted_models WHERE model_id = ?",
@@ -31,27 +394,77 @@ class Database:
             )
             return cursor.fetchone()
     
-    def update_highlighted_model(self, model_data):
-        with sqlite3.connect(self.db_path) as conn:
+    def get_highlighted_models(self, model_ids):
+        """Load previous records for many models, keyed by model id."""
+        model_ids = list(model_ids)
+        records = {}
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute('''
-                INSERT OR REPLACE INTO highlighted_models 
-                (model_id, author, last_highlighted, last_modified, likes, downloads)
-                VALUES (?, ?, ?, ?, ?, ?)
-            ''', (
-                model_data['model_id'],
-                model_data['author'],
-                datetime.now().isoformat(),
-                model_data['last_modified'],
-                model_data['likes'],
-                model_data['downloads']
-            ))
+            for i in range(0, len(model_ids), MAX_QUERY_PARAMS):
+                chunk = model_ids[i:i + MAX_QUERY_PARAMS]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(
+                    f"SELECT * FROM highlighted_models WHERE model_id IN ({placeholders})",
+                    chunk
+                )
+                for row in cursor.fetchall():
+                    records[row[0]] = row
+        return records
+    
+    def update_highlighted_model(self, model_data):
+        self.update_highlighted_models([model_data])
+    
+    def update_highlighted_models(self, models):
+        """Upsert many highlighted models in a single transaction."""
+        with self._connect() as conn:
+            self._upsert_highlights(conn.cursor(), models)
             conn.commit()
     
+    def _upsert_highlights(self, cursor, models):
+        # A true upsert: INSERT OR REPLACE deletes the old row without firing
+        # the delete trigger, which would skew the statistics
+        now = datetime.now().isoformat()
+        cursor.executemany('''
+            INSERT INTO highlighted_models
+            (model_id, author, last_highlighted, last_modified, likes, downloads, repo_type)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (model_id) DO UPDATE SET
+                author = excluded.author,
+                last_highlighted = excluded.last_highlighted,
+                last_modified = excluded.last_modified,
+                likes = excluded.likes,
+                downloads = excluded.downloads,
+                repo_type = excluded.repo_type
+        ''', [(
+            model_data['model_id'],
+            model_data['author'],
+            now,
+            model_data['last_modified'],
+            model_data['likes'],
+            model_data['downloads'],
+            model_data.get('repo_type', 'model')
+        ) for model_data in models])
+    
     def calculate_growth_metrics(self, model_id, last_modified, likes, downloads):
         """Calculate growth metrics for a model."""
         previous = self.get_highlighted_model(model_id)
+        return self._growth_metrics(previous, last_modified, likes, downloads)
+    
+    def calculate_growth_metrics_bulk(self, models):
+        """Calculate growth metrics for many models with a single lookup.
         
+        models is a list of (model_id, last_modified, likes, downloads) tuples;
+        the returned list of metrics is in the same order.
+        """
+        models = list(models)
+        with get_metrics().span('db_growth_lookup'):
+            previous = self.get_highlighted_models(model[0] for model in models)
+        return [
+            self._growth_metrics(previous.get(model_id), last_modified, likes, downloads)
+            for model_id, last_modified, likes, downloads in models
+        ]
+    
+    def _growth_metrics(self, previous, last_modified, likes, downloads):
         if not previous:
             return {
                 'is_new': True,
@@ -62,13 +475,18 @@ class Database:
             }
         
         # Calculate time-based metrics
-        prev_modified = datetime.fromisoformat(previous[3])
-        if isinstance(last_modified, str):
-            curr_modified = datetime.fromisoformat(last_modified.replace('Z', '+00:00'))
+        if last_modified is None or previous[3] is None:
+            # Lean listings carry no modification date; fall back to the time
+            # since the model was last highlighted
+            days_since_update = (datetime.now() - datetime.fromisoformat(previous[2])).days
         else:
-            curr_modified = last_modified
-        
-        days_since_update = (curr_modified - prev_modified).days
+            prev_modified = datetime.fromisoformat(previous[3])
+            if isinstance(last_modified, str):
+                curr_modified = datetime.fromisoformat(last_modified.replace('Z', '+00:00'))
+            else:
+                curr_modified = last_modified
+            
+            days_since_update = (curr_modified - prev_modified).days
         
         # Calculate growth metrics
         prev_likes = previous[4]
@@ -125,20 +543,547 @@ class Database:
         
         return False
     
+    def record_snapshots(self, snapshots, ts=None, repo_type='model'):
+        """Store one snapshot per model for this run.
+        
+        snapshots is an iterable of (model_id, likes, downloads, rank) tuples,
+        ranked within their repo type's listing.
+        """
+        ts = int(ts if ts is not None else time.time())
+        with self._connect() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO model_snapshots (model_id, ts, likes, downloads, rank, repo_type)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', ((model_id, ts, likes, downloads, rank, repo_type)
+                  for model_id, likes, downloads, rank in snapshots))
+        return ts
+    
+    def prune_snapshots(self, full_resolution_days=FULL_RESOLUTION_DAYS, retention_days=365, now=None):
+        """Apply the snapshot retention policy.
+        
+        Snapshots newer than full_resolution_days are kept as-is, older ones are
+        downsampled to the last snapshot per model per week, and anything older
+        than retention_days is deleted.
+        """
+        now = int(now if now is not None else time.time())
+        downsample_before = now - full_resolution_days * DAY_SECONDS
+        delete_before = now - retention_days * DAY_SECONDS
+        with self._connect() as conn:
+            conn.execute("DELETE FROM model_snapshots WHERE ts < ?", (delete_before,))
+            # Each row probes the primary key for a later snapshot of the
+            # same model in its week, so the cost grows with the rows pruned
+            conn.execute('''
+                DELETE FROM model_snapshots AS s
+                WHERE ts < :before
+                AND EXISTS (
+                    SELECT 1 FROM model_snapshots t
+                    WHERE t.model_id = s.model_id
+                    AND t.ts > s.ts AND t.ts < :before
+                    AND t.ts / :week = s.ts / :week
+                )
+            ''', {'before': downsample_before, 'week': WEEK_SECONDS})
+    
+    def get_snapshot_growth(self, ts=None, repo_type=None):
+        """Compute 7-day and 30-day growth for every model in the latest snapshot.
+        
+        Growth is measured against the oldest snapshot inside each window and is
+        None when there is no earlier snapshot to compare with. ts selects the
+        snapshot to measure (default: the latest) and repo_type limits the
+        result to one kind of repo.
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                WITH latest AS (
+                    SELECT COALESCE(:ts, MAX(ts)) AS ts FROM model_snapshots
+                ),
+                windowed AS (
+                    SELECT
+                        model_id, ts, likes, downloads, rank,
+                        FIRST_VALUE(ts) OVER w7 AS ts_7d,
+                        FIRST_VALUE(likes) OVER w7 AS likes_7d,
+                        FIRST_VALUE(downloads) OVER w7 AS downloads_7d,
+                        FIRST_VALUE(ts) OVER w30 AS ts_30d,
+                        FIRST_VALUE(likes) OVER w30 AS likes_30d,
+                        FIRST_VALUE(downloads) OVER w30 AS downloads_30d
+                    FROM model_snapshots
+                    WHERE ts >= (SELECT ts FROM latest) - :month
+                      AND (:repo_type IS NULL OR repo_type = :repo_type)
+                    WINDOW
+                        w7 AS (PARTITION BY model_id ORDER BY ts
+                               RANGE BETWEEN :week PRECEDING AND CURRENT ROW),
+                        w30 AS (PARTITION BY model_id ORDER BY ts
+                                RANGE BETWEEN :month PRECEDING AND CURRENT ROW)
+                )
+                SELECT
+                    model_id, likes, downloads, rank,
+                    CASE WHEN ts_7d < ts AND likes_7d > 0
+                         THEN (likes - likes_7d) * 1.0 / likes_7d END,
+                    CASE WHEN ts_7d < ts AND downloads_7d > 0
+                         THEN (downloads - downloads_7d) * 1.0 / downloads_7d END,
+                    CASE WHEN ts_30d < ts AND likes_30d > 0
+                         THEN (likes - likes_30d) * 1.0 / likes_30d END,
+                    CASE WHEN ts_30d < ts AND downloads_30d > 0
+                         THEN (downloads - downloads_30d) * 1.0 / downloads_30d END
+                FROM windowed
+                WHERE ts = (SELECT ts FROM latest)
+            ''', {'week': WEEK_SECONDS, 'month': 30 * DAY_SECONDS, 'ts': ts,
+                  'repo_type': repo_type})
+            
+            return {
+                row[0]: {
+                    'likes': row[1],
+                    'downloads': row[2],
+                    'rank': row[3],
+                    'likes_growth_7d': row[4],
+                    'downloads_growth_7d': row[5],
+                    'likes_growth_30d': row[6],
+                    'downloads_growth_30d': row[7]
+                }
+                for row in cursor.fetchall()
+            }
+    
+    def get_latest_snapshot_ts(self):
+        """Timestamp of the most recent run's snapshots, or None if there are none."""
+        with self._connect() as conn:
+            return conn.execute("SELECT MAX(ts) FROM model_snapshots").fetchone()[0]
+    
+    def iter_snapshot_history(self, since=None, repo_types=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """Stream every stored snapshot, run by run, for replaying history.
+        
+        Yields chunks of (ts, repo_type, model_id, likes, downloads, rank)
+        tuples ordered by ts, then by rank within each repo type. since (a
+        datetime) and repo_types narrow the history in SQL.
+        """
+        query = "SELECT ts, repo_type, model_id, likes, downloads, rank FROM model_snapshots"
+        conditions, params = [], []
+        if since is not None:
+            conditions.append("ts >= ?")
+            params.append(int(since.timestamp()))
+        if repo_types:
+            conditions.append(f"repo_type IN ({', '.join('?' for _ in repo_types)})")
+            params.extend(repo_types)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " ORDER BY ts, repo_type, rank"
+        
+        cursor = self._connect().cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+    
+    def add_subscribers(self, subscribers, segment=None):
+        """Add or reactivate subscribers given as (email, name) tuples.
+        
+        With a segment, they are (re)assigned to it; otherwise an existing
+        subscriber keeps their segment.
+        """
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            if segment is not None and conn.execute(
+                "SELECT 1 FROM segments WHERE name = ?", (segment,)
+            ).fetchone() is None:
+                raise ValueError(f"Unknown segment: {segment}")
+            conn.executemany('''
+                INSERT INTO subscribers (email, name, subscribed_at, active, segment)
+                VALUES (?, ?, ?, 1, ?)
+                ON CONFLICT(email) DO UPDATE SET
+                    active = 1,
+                    name = COALESCE(excluded.name, subscribers.name),
+                    segment = COALESCE(excluded.segment, subscribers.segment)
+            ''', [(email.strip().lower(), name, now, segment) for email, name in subscribers])
+    
+    def add_subscriber(self, email, name=None, segment=None):
+        self.add_subscribers([(email, name)], segment)
+    
+    def remove_subscriber(self, email):
+        """Deactivate a subscriber, keeping the record. Returns False if unknown."""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE subscribers SET active = 0 WHERE email = ?",
+                (email.strip().lower(),)
+            )
+            return cursor.rowcount > 0
+    
+    def get_active_subscribers(self):
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "SELECT email FROM subscribers WHERE active = 1 ORDER BY email"
+            )
+            return [row[0] for row in cursor.fetchall()]
+    
+    def get_subscriber_segments(self):
+        """Segment of every active subscriber that has one, as {email: segment}."""
+        with self._connect() as conn:
+            return dict(conn.execute(
+                "SELECT email, segment FROM subscribers WHERE active = 1 AND segment IS NOT NULL"
+            ).fetchall())
+    
+    def save_segment(self, name, tags=(), authors=(), exclude_authors=()):
+        """Create or replace a segment."""
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT INTO segments (name, tags, authors, exclude_authors)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT(name) DO UPDATE SET
+                    tags = excluded.tags,
+                    authors = excluded.authors,
+                    exclude_authors = excluded.exclude_authors
+            ''', (name, json.dumps(list(tags)), json.dumps(list(authors)),
+                  json.dumps(list(exclude_authors))))
+    
+    def remove_segment(self, name):
+        """Delete a segment; its subscribers go back to the full edition.
+        
+        Returns the number of subscribers moved, or None if the segment is unknown.
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            moved = cursor.execute(
+                "UPDATE subscribers SET segment = NULL WHERE segment = ?", (name,)
+            ).rowcount
+            if cursor.execute("DELETE FROM segments WHERE name = ?", (name,)).rowcount == 0:
+                return None
+            return moved
+    
+    def get_segments(self):
+        """All segments as {name: {'tags', 'authors', 'exclude_authors'}}."""
+        with self._connect() as conn:
+            return {
+                name: {
+                    'tags': json.loads(tags or '[]'),
+                    'authors': json.loads(authors or '[]'),
+                    'exclude_authors': json.loads(exclude_authors or '[]')
+                }
+                for name, tags, authors, exclude_authors in conn.execute(
+                    "SELECT name, tags, authors, exclude_authors FROM segments ORDER BY name"
+                ).fetchall()
+            }
+    
+    def create_edition(self, subject, html, text, highlights, recipients, run_id=None,
+                       variants=None):
+        """Store a rendered edition and queue it for every recipient.
+        
+        variants are segment renderings, dicts with 'segments', 'html', 'text'
+        and their own 'recipients'; they are numbered from 1 in the outbox.
+        If run_id is given, the run is checkpointed as 'rendered' in the same
+        transaction. Returns the new edition id.
+        """
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                INSERT INTO editions (created_at, subject, html, text, highlights)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (now, subject, html, text, json.dumps(highlights, default=str)))
+            edition_id = cursor.lastrowid
+            cursor.executemany('''
+                INSERT OR IGNORE INTO outbox (edition_id, recipient, idempotency_key, updated_at)
+                VALUES (?, ?, ?, ?)
+            ''', [(edition_id, recipient, f"{edition_id}:{recipient}", now)
+                  for recipient in recipients])
+            for number, variant in enumerate(variants or [], 1):
+                cursor.execute('''
+                    INSERT INTO edition_variants (edition_id, variant, segments, html, text)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (edition_id, number, json.dumps(variant['segments']),
+                      variant['html'], variant['text']))
+                cursor.executemany('''
+                    INSERT OR IGNORE INTO outbox (edition_id, recipient, idempotency_key, updated_at, variant)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', [(edition_id, recipient, f"{edition_id}:{recipient}", now, number)
+                      for recipient in variant['recipients']])
+            if run_id is not None:
+                cursor.execute(
+                    "UPDATE runs SET stage = 'rendered', edition_id = ?, updated_at = ? WHERE id = ?",
+                    (edition_id, now, run_id)
+                )
+            conn.commit()
+        return edition_id
+    
+    def get_edition(self, edition_id):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, created_at, subject, html, text, highlights, status FROM editions WHERE id = ?",
+                (edition_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'created_at': row[1],
+            'subject': row[2],
+            'html': row[3],
+            'text': row[4],
+            'highlights': json.loads(row[5] or '[]'),
+            'status': row[6]
+        }
+    
+    def get_edition_variant(self, edition_id, variant):
+        """The (html, text) a variant of an edition is sent with."""
+        with self._connect() as conn:
+            if variant == 0:
+                return conn.execute(
+                    "SELECT html, text FROM editions WHERE id = ?", (edition_id,)
+                ).fetchone()
+            return conn.execute(
+                "SELECT html, text FROM edition_variants WHERE edition_id = ? AND variant = ?",
+                (edition_id, variant)
+            ).fetchone()
+    
+    def get_pending_editions(self):
+        """Ids of editions that still have undelivered recipients, oldest first."""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute(
+                "SELECT id FROM editions WHERE status = 'pending' ORDER BY id"
+            ).fetchall()]
+    
+    def claim_outbox(self, edition_id, limit):
+        """Mark up to `limit` pending rows as sending and return them.
+        
+        Returns (recipient, idempotency_key, attempts, variant) tuples. Claiming happens
+        before the send, so a crash mid-send leaves the rows in 'sending' and a
+        recovery run will not send them again.
+        """
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT recipient, idempotency_key, attempts + 1, variant FROM outbox
+                WHERE edition_id = ? AND status = 'pending'
+                ORDER BY recipient
+                LIMIT ?
+            ''', (edition_id, limit))
+            rows = cursor.fetchall()
+            cursor.executemany('''
+                UPDATE outbox SET status = 'sending', attempts = attempts + 1, updated_at = ?
+                WHERE edition_id = ? AND recipient = ?
+            ''', [(now, edition_id, recipient) for recipient, _, _, _ in rows])
+            conn.commit()
+        return rows
+    
+    def update_outbox(self, edition_id, updates):
+        """Record delivery results given as (recipient, status, message_id, error)."""
+        now = datetime.now().isoformat()
+        with self._connect() as conn:
+            conn.executemany('''
+                UPDATE outbox SET status = ?, message_id = ?, error = ?, updated_at = ?
+                WHERE edition_id = ? AND recipient = ?
+            ''', [(status, message_id, error, now, edition_id, recipient)
+                  for recipient, status, message_id, error in updates])
+            conn.commit()
+    
+    def reset_unconfirmed(self):
+        """Requeue rows whose delivery was never confirmed and reopen their editions.
+        
+        Only use this after checking Postmark, since these rows may already
+        have been sent. Returns the number of requeued rows.
+        """
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE editions SET status = 'pending', completed_at = NULL
+                WHERE id IN (SELECT DISTINCT edition_id FROM outbox WHERE status = 'sending')
+            ''')
+            cursor.execute("UPDATE outbox SET status = 'pending' WHERE status = 'sending'")
+            conn.commit()
+            return cursor.rowcount
+    
+    def get_outbox_counts(self, edition_id):
+        """Number of an edition's outbox rows in each status."""
+        with self._connect() as conn:
+            return dict(conn.execute(
+                "SELECT status, COUNT(*) FROM outbox WHERE edition_id = ? GROUP BY status",
+                (edition_id,)
+            ).fetchall())
+    
+    def complete_edition(self, edition_id):
+        """Close an edition once every row is sent or failed.
+        
+        If any recipient received it, its highlights are committed in the same
+        transaction. Returns the final status, or None if rows are still
+        pending or unconfirmed ('sending'), which only --resend-unconfirmed
+        resolves.
+        """
+        now = datetime.now().isoformat()
+        with get_metrics().span('db_complete_edition'), self._connect() as conn:
+            cursor = conn.cursor()
+            counts = dict(cursor.execute(
+                "SELECT status, COUNT(*) FROM outbox WHERE edition_id = ? GROUP BY status",
+                (edition_id,)
+            ).fetchall())
+            if counts.get('pending') or counts.get('sending'):
+                return None
+            
+            status = 'delivered' if counts.get('sent') else 'failed'
+            if status == 'delivered':
+                highlights = cursor.execute(
+                    "SELECT highlights FROM editions WHERE id = ?", (edition_id,)
+                ).fetchone()[0]
+                self._upsert_highlights(cursor, json.loads(highlights or '[]'))
+            cursor.execute(
+                "UPDATE editions SET status = ?, completed_at = ? WHERE id = ?",
+                (status, now, edition_id)
+            )
+            run = cursor.execute(
+                "SELECT id FROM runs WHERE edition_id = ?", (edition_id,)
+            ).fetchone()
+            if run is not None:
+                if status == 'delivered':
+                    cursor.execute("UPDATE runs SET stage = 'sent' WHERE id = ?", (run[0],))
+                self._close_run(cursor, run[0], 'completed' if status == 'delivered' else 'failed')
+            conn.commit()
+        return status
+    
+    def resume_run(self, params, max_age=RUN_MAX_AGE):
+        """Return the id of the run to continue, starting a new one if needed.
+        
+        The latest unfinished run is resumed if it was started with the same
+        params less than max_age seconds ago. Any other unfinished run is
+        marked abandoned.
+        """
+        now = time.time()
+        params_json = json.dumps(params, sort_keys=True)
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            row = cursor.execute('''
+                SELECT id, params, started_ts FROM runs
+                WHERE status = 'running'
+                ORDER BY id DESC
+                LIMIT 1
+            ''').fetchone()
+            if row is not None and row[1] == params_json and row[2] >= now - max_age:
+                return row[0]
+            
+            self._abandon_runs(cursor)
+            cursor.execute('''
+                INSERT INTO runs (started_at, started_ts, updated_at, params)
+                VALUES (?, ?, ?, ?)
+            ''', (datetime.fromtimestamp(now).isoformat(), int(now),
+                  datetime.fromtimestamp(now).isoformat(), params_json))
+            run_id = cursor.lastrowid
+            conn.commit()
+        return run_id
+    
+    def abandon_runs(self):
+        """Mark every unfinished run abandoned so the next one starts fresh."""
+        with self._connect() as conn:
+            self._abandon_runs(conn.cursor())
+            conn.commit()
+    
+    def _abandon_runs(self, cursor):
+        for (run_id,) in cursor.execute(
+            "SELECT id FROM runs WHERE status = 'running'"
+        ).fetchall():
+            self._close_run(cursor, run_id, 'abandoned')
+    
+    def get_run(self, run_id):
+        with self._connect() as conn:
+            row = conn.execute('''
+                SELECT id, started_ts, stage, status, listing, selected, edition_id
+                FROM runs WHERE id = ?
+            ''', (run_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            'id': row[0],
+            'started_ts': row[1],
+            'stage': row[2],
+            'status': row[3],
+            # Both keyed by repo type
+            'listing': json.loads(row[4]) if row[4] is not None else {},
+            'selected': json.loads(row[5]) if row[5] is not None else {},
+            'edition_id': row[6]
+        }
+    
+    def checkpoint_run(self, run_id, stage, repo_type='model', listing=None, selected=None):
+        """Record that a run completed a stage, storing its results if given.
+        
+        Listings and selections are stored per repo type, so the pipelines of
+        different repo types can checkpoint concurrently. The run's stage only
+        moves forward.
+        """
+        now = datetime.now().isoformat()
+        with self._run_lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT stage, listing, selected FROM runs WHERE id = ?", (run_id,)
+            ).fetchone()
+            if RUN_STAGES.index(stage) > RUN_STAGES.index(row[0]):
+                current_stage = stage
+            else:
+                current_stage = row[0]
+            listings = json.loads(row[1] or '{}')
+            selections = json.loads(row[2] or '{}')
+            if listing is not None:
+                listings[repo_type] = listing
+            if selected is not None:
+                selections[repo_type] = selected
+            conn.execute('''
+                UPDATE runs SET stage = ?, updated_at = ?, listing = ?, selected = ?
+                WHERE id = ?
+            ''', (
+                current_stage, now,
+                json.dumps(listings, default=str) if listings else None,
+                json.dumps(selections, default=str) if selections else None,
+                run_id
+            ))
+            conn.commit()
+    
+    def record_enrichment(self, run_id, model_id, details):
+        """Store one model's fetched details for a run."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO run_enrichment (run_id, model_id, details) VALUES (?, ?, ?)",
+                (run_id, model_id, json.dumps(details, default=str))
+            )
+            conn.commit()
+    
+    def get_run_enrichment(self, run_id):
+        """Details fetched so far by a run, keyed by model id."""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT model_id, details FROM run_enrichment WHERE run_id = ?", (run_id,)
+            ).fetchall()
+        return {model_id: json.loads(details) for model_id, details in rows}
+    
+    def finish_run(self, run_id, status='completed'):
+        with self._connect() as conn:
+            self._close_run(conn.cursor(), run_id, status)
+            conn.commit()
+    
+    def _close_run(self, cursor, run_id, status):
+        # The stored listing and enrichment are only needed to resume
+        cursor.execute(
+            "UPDATE runs SET status = ?, updated_at = ?, listing = NULL, selected = NULL WHERE id = ?",
+            (status, datetime.now().isoformat(), run_id)
+        )
+        cursor.execute("DELETE FROM run_enrichment WHERE run_id = ?", (run_id,))
+    
     def get_statistics(self):
-        with sqlite3.connect(self.db_path) as conn:
+        """Summary of the highlight history for --stats.
+        
+        Totals and author counts come from the trigger-maintained summary
+        tables and the top-5 lists from indexes, so the cost does not grow
+        with the number of highlighted models.
+        """
+        with self._connect() as conn:
             cursor = conn.cursor()
             
             # Get total number of models
-            cursor.execute("SELECT COUNT(*) FROM highlighted_models")
+            cursor.execute("SELECT total_models FROM stats_summary WHERE id = 1")
             total_models = cursor.fetchone()[0]
             
             # Get most highlighted authors
             cursor.execute("""
-                SELECT author, COUNT(*) as count 
-                FROM highlighted_models 
-                GROUP BY author 
-                ORDER BY count DESC 
+                SELECT author, models 
+                FROM author_counts 
+                ORDER BY models DESC 
                 LIMIT 5
             """)
             top_authors = cursor.fetchall()
@@ -168,16 +1113,35 @@ class Database:
                 'most_liked': most_liked
             }
     
-    def export_to_csv(self, output_path):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT * FROM highlighted_models")
-            rows = cursor.fetchall()
-            
-            headers = ['model_id', 'author', 'last_highlighted', 
-                      'last_modified', 'likes', 'downloads']
-            
-            with open(output_path, 'w') as f:
-                f.write(','.join(headers) + '\n')
-                for row in rows:
-                    f.write(','.join(str(x) for x in row) + '\n')
\ No newline at end of file
+    def iter_export_rows(self, table='highlights', since=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """Stream a table's rows in chunks of at most chunk_size tuples.
+        
+        since (a datetime) keeps only rows highlighted or snapshotted at or
+        after it; the filter runs in SQL. Rows are read from the cursor as
+        they are written out, so memory use does not grow with the table.
+        """
+        sql_table, columns, since_column, order = EXPORT_TABLES[table]
+        query = f"SELECT {', '.join(name for name, _ in columns)} FROM {sql_table}"
+        params = []
+        if since is not None:
+            query += f" WHERE {since_column} >= ?"
+            # Highlights store ISO timestamps, snapshots unix seconds
+            params.append(int(since.timestamp()) if table == 'snapshots' else since.isoformat())
+        query += f" ORDER BY {order}"
+        
+        # A cursor of its own, so other queries on this thread can run meanwhile
+        cursor = self._connect().cursor()
+        try:
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
+    
+    def export_to_csv(self, output_path, since=None):
+        """Export highlighted models to CSV. Returns the number of rows."""
+        from export import export_table
+        return export_table(self, output_path, 'csv', since=since)
\ No newline at end of file
@@ -0,0 +1,156 @@
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from dotenv import load_dotenv
+from postmarker.core import PostmarkClient, DEFAULT_API
+
+logger = logging.getLogger('hf_newsletter')
+
+# Postmark accepts at most 500 messages per batch call
+BATCH_SIZE = 500
+DEFAULT_CONCURRENCY = 4
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+DEFAULT_TIMEOUT = 30.0
+
+# ErrorCode reported for messages whose batch call failed outright
+TRANSPORT_ERROR = -1
+
+_client = None
+_client_lock = threading.Lock()
+_env_loaded = False
+
+def load_environment():
+    """Load .env once per process."""
+    global _env_loaded
+    if not _env_loaded:
+        load_dotenv()
+        _env_loaded = True
+
+def get_sender():
+    load_environment()
+    return os.getenv('SENDER_EMAIL', 'newsletter@openhands.dev')
+
+def get_postmark_client():
+    """Return the process-wide Postmark client, creating it on first use.
+
+    Reusing one client keeps its HTTP session (and connections) alive across
+    sends. POSTMARK_API_URL points it at another server, e.g. a local fake.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            load_environment()
+            postmark_token = os.getenv('POSTMARK_TOKEN')
+            if not postmark_token:
+                raise ValueError("POSTMARK_TOKEN not found in environment variables")
+            _client = PostmarkClient(
+                server_token=postmark_token,
+                timeout=float(os.getenv('POSTMARK_TIMEOUT', DEFAULT_TIMEOUT)),
+                root_api_url=os.getenv('POSTMARK_API_URL', DEFAULT_API)
+            )
+        return _client
+
+def is_unconfirmed(error):
+    """Whether Postmark may have accepted a call that raised this error.
+    
+    A read timeout means the request went out but no answer came back, so
+    resending could deliver the same message twice.
+    """
+    return isinstance(error, requests.ReadTimeout)
+
+def is_transient(error):
+    """Whether a failed Postmark call is worth retrying."""
+    if is_unconfirmed(error):
+        return False
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    # postmarker raises ClientError from the underlying HTTPError
+    response = getattr(error, 'response', None)
+    if response is None:
+        response = getattr(error.__cause__, 'response', None)
+    status = getattr(response, 'status_code', None)
+    return status is not None and (status == 429 or status >= 500)
+
+def build_message(recipient, subject, html_content, text_content=None, sender=None, metadata=None):
+    message = {
+        'From': sender or get_sender(),
+        'To': recipient,
+        'Subject': subject,
+        'HtmlBody': html_content,
+        'MessageStream': 'outbound'  # Default stream
+    }
+    if text_content:
+        message['TextBody'] = text_content
+    if metadata:
+        message['Metadata'] = metadata
+    return message
+
+def send_batch(client, messages, max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF):
+    """Send one batch of up to BATCH_SIZE messages, retrying transient failures.
+
+    Returns Postmark's per-message responses, in the same order as messages.
+    """
+    attempt = 0
+    while True:
+        try:
+            return client.emails.send_batch(*messages)
+        except Exception as e:
+            if not is_transient(e) or attempt >= max_retries:
+                raise
+            delay = backoff * (2 ** attempt)
+            logger.warning(f"Batch send failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+def deliver(messages, client=None, batch_size=BATCH_SIZE, concurrency=None,
+            max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF):
+    """Send many messages through Postmark's batch endpoint.
+
+    Messages are split into batches that are sent concurrently. A batch that
+    still fails after retries is reported with ErrorCode TRANSPORT_ERROR rather
+    than aborting the other batches; 'Unconfirmed' is set when Postmark may
+    have accepted it anyway.
+
+    Returns a summary dict with sent/failed counts, elapsed seconds, throughput
+    in messages per second and the per-message results in input order.
+    """
+    if client is None:
+        client = get_postmark_client()
+    if concurrency is None:
+        concurrency = int(os.getenv('POSTMARK_CONCURRENCY', DEFAULT_CONCURRENCY))
+    messages = list(messages)
+    batches = [messages[i:i + batch_size] for i in range(0, len(messages), batch_size)]
+
+    def send(batch):
+        try:
+            return send_batch(client, batch, max_retries, backoff)
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} messages failed: {str(e)}")
+            return [{
+                'ErrorCode': TRANSPORT_ERROR,
+                'Message': str(e),
+                'To': message['To'],
+                'Unconfirmed': is_unconfirmed(e)
+            } for message in batch]
+
+    start = time.perf_counter()
+    results = []
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            for batch_results in executor.map(send, batches):
+                results.extend(batch_results)
+    elapsed = time.perf_counter() - start
+
+    sent = sum(1 for result in results if result.get('ErrorCode') == 0)
+    return {
+        'sent': sent,
+        'failed': len(results) - sent,
+        'elapsed': elapsed,
+        'rate': sent / elapsed if elapsed > 0 else 0.0,
+        'results': results
+    }
@@ -1,129 +1,295 @@
+import html
 from datetime import datetime
 
-def get_email_template(projects):
-    """Generate the HTML email template with the given projects."""
-    
-    # Start with the HTML header and styles
-    html = f"""
+# Static parts of the email are built once at import time
+_STYLE = """
+    body { 
+        font-family: Arial, sans-serif; 
+        line-height: 1.6;
+        background-color: #f9fafb;
+        padding: 20px;
+        max-width: 800px;
+        margin: 0 auto;
+    }
+    .project { 
+        margin-bottom: 30px; 
+        padding: 20px; 
+        border: 1px solid #e5e7eb;
+        border-radius: 12px;
+        background-color: #ffffff;
+        box-shadow: 0 2px 4px rgba(0,0,0,0.05);
+    }
+    .title { 
+        color: #2563eb; 
+        font-size: 20px; 
+        font-weight: bold;
+        margin-bottom: 8px;
+    }
+    .title a {
+        color: inherit;
+        text-decoration: none;
+    }
+    .title a:hover {
+        text-decoration: underline;
+    }
+    .author { 
+        color: #4b5563;
+        margin-bottom: 8px;
+    }
+    .growth {
+        color: #059669;
+        font-weight: 600;
+        margin: 8px 0;
+        font-size: 14px;
+        background-color: #ecfdf5;
+        padding: 4px 8px;
+        border-radius: 4px;
+        display: inline-block;
+    }
+    .description { 
+        color: #1f2937;
+        margin: 16px 0;
+        line-height: 1.6;
+    }
+    .stats { 
+        display: flex;
+        flex-wrap: wrap;
+        gap: 20px;
+        color: #6b7280;
+        font-size: 14px;
+        margin: 12px 0;
+        padding: 8px 0;
+        border-top: 1px solid #f3f4f6;
+    }
+    .tags {
+        margin-top: 8px;
+    }
+    .section {
+        color: #111827;
+        font-size: 22px;
+        margin: 32px 0 16px;
+        padding-bottom: 8px;
+        border-bottom: 2px solid #e5e7eb;
+    }
+    .tag {
+        background-color: #f3f4f6;
+        padding: 4px 8px;
+        border-radius: 4px;
+        font-size: 12px;
+        color: #4b5563;
+        margin-right: 6px;
+        margin-bottom: 4px;
+        display: inline-block;
+    }
+"""
+
+_HEAD = """
     <html>
         <head>
-            <style>
-                body {{ 
-                    font-family: Arial, sans-serif; 
-                    line-height: 1.6;
-                    background-color: #f9fafb;
-                    padding: 20px;
-                    max-width: 800px;
-                    margin: 0 auto;
-                }}
-                .project {{ 
-                    margin-bottom: 30px; 
-                    padding: 20px; 
-                    border: 1px solid #e5e7eb;
-                    border-radius: 12px;
-                    background-color: #ffffff;
-                    box-shadow: 0 2px 4px rgba(0,0,0,0.05);
-                }}
-                .title {{ 
-                    color: #2563eb; 
-                    font-size: 20px; 
-                    font-weight: bold;
-                    margin-bottom: 8px;
-                }}
-                .title a {{
-                    color: inherit;
-                    text-decoration: none;
-                }}
-                .title a:hover {{
-                    text-decoration: underline;
-                }}
-                .author {{ 
-                    color: #4b5563;
-                    margin-bottom: 8px;
-                }}
-                .growth {{
-                    color: #059669;
-                    font-weight: 600;
-                    margin: 8px 0;
-                    font-size: 14px;
-                    background-color: #ecfdf5;
-                    padding: 4px 8px;
-                    border-radius: 4px;
-                    display: inline-block;
-                }}
-                .description {{ 
-                    color: #1f2937;
-                    margin: 16px 0;
-                    line-height: 1.6;
-                }}
-                .stats {{ 
-                    display: flex;
-                    flex-wrap: wrap;
-                    gap: 20px;
-                    color: #6b7280;
-                    font-size: 14px;
-                    margin: 12px 0;
-                    padding: 8px 0;
-                    border-top: 1px solid #f3f4f6;
-                }}
-                .tags {{
-                    margin-top: 8px;
-                }}
-                .tag {{
-                    background-color: #f3f4f6;
-                    padding: 4px 8px;
-                    border-radius: 4px;
-                    font-size: 12px;
-                    color: #4b5563;
-                    margin-right: 6px;
-                    margin-bottom: 4px;
-                    display: inline-block;
-                }}
-            </style>
+            <style>""" + _STYLE + """</style>
         </head>
         <body>
-            <h1>🤗 Rising Stars in Top 500</h1>
-            <p>Here are the fastest-growing models among Hugging Face's most-downloaded models as of {datetime.now().strftime('%Y-%m-%d')}:</p>
-    """
-    
-    # Add each project to the template
-    for project in projects:
-        # Format tags
-        tags_html = ""
-        if project['tags']:
-            tags = project['tags'][:5]  # Take first 5 tags
-            tags_html = '<div class="tags">' + ''.join([f'<span class="tag">{tag}</span>' for tag in tags]) + '</div>'
-        
-        # Format last modified date
-        try:
-            if isinstance(project['last_modified'], str):
-                last_modified = datetime.fromisoformat(project['last_modified'].replace('Z', '+00:00'))
-            else:
-                last_modified = project['last_modified']
-            last_modified_str = last_modified.strftime('%Y-%m-%d')
-        except (ValueError, AttributeError):
-            last_modified_str = "Recently"
-        
-        # Add project section
-        html += f"""
+"""
+
+_INTRO = """
+            <h1>🤗 Rising Stars in Top {window}</h1>
+            <p>Here are the fastest-growing {subject} as of {date}:</p>
+"""
+
+_SECTION = """
+            <h2 class="section">{title}</h2>
+"""
+
+SECTION_TITLES = {'model': 'Models', 'dataset': 'Datasets', 'space': 'Spaces'}
+SECTION_PLURALS = {'model': 'models', 'dataset': 'datasets', 'space': 'Spaces'}
+
+_CARD = """
             <div class="project">
-                <div class="title"><a href="{project['link']}">{project['title']}</a></div>
-                <div class="author">by {project['author']}</div>
-                {f'<div class="growth">{project["growth"]}</div>' if project.get('growth') else ''}
-                <div class="description">{project['description']}</div>
+                <div class="title"><a href="{link}">{title}</a></div>
+                <div class="author">by {author}</div>
+                {growth_html}
+                <div class="description">{description}</div>
                 <div class="stats">
-                    <span>❤️ {project['likes']}</span>
-                    <span>⬇️ {project['downloads']:,} downloads</span>
-                    <span>🕒 Updated: {last_modified_str}</span>
+                    <span>❤️ {likes}</span>
+                    {downloads_html}
+                    <span>🕒 Updated: {updated}</span>
+                    {trend_html}
                 </div>
                 {tags_html}
             </div>
-        """
-    
-    # Close the HTML
-    html += """
+"""
+
+_FOOT = """
         </body>
     </html>
+"""
+
+def _escape(value):
+    return html.escape(str(value), quote=True)
+
+def _format_date(value):
+    try:
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        return value.strftime('%Y-%m-%d')
+    except (ValueError, AttributeError):
+        return "Recently"
+
+def prepare_project(project):
+    """Preformat a project's display fields once.
+    
+    The result can be passed to render_card() and render_text_card() any number
+    of times without re-parsing dates or reformatting numbers.
+    """
+    trend = project.get('trend') or {}
+    downloads_growth_7d = trend.get('downloads_growth_7d')
+    return {
+        'link': str(project['link']),
+        'title': str(project['title']),
+        'author': str(project['author']),
+        'growth': project.get('growth') or '',
+        'description': str(project['description']),
+        'likes': str(project['likes']),
+        # Spaces have no download counts
+        'downloads': (
+            f"{project['downloads']:,}" if project.get('repo_type', 'model') != 'space' else ''
+        ),
+        'updated': _format_date(project['last_modified']),
+        'trend': (
+            f"📊 {downloads_growth_7d * 100:+.0f}% downloads this week"
+            if downloads_growth_7d is not None else ''
+        ),
+        'tags': [str(tag) for tag in (project.get('tags') or [])[:5]]  # Take first 5 tags
+    }
+
+def render_card(fields):
+    """Render one HTML project card from prepare_project() output."""
+    return _CARD.format(
+        link=_escape(fields['link']),
+        title=_escape(fields['title']),
+        author=_escape(fields['author']),
+        growth_html=f'<div class="growth">{_escape(fields["growth"])}</div>' if fields['growth'] else '',
+        description=_escape(fields['description']),
+        likes=_escape(fields['likes']),
+        downloads_html=f'<span>⬇️ {fields["downloads"]} downloads</span>' if fields['downloads'] else '',
+        updated=fields['updated'],
+        trend_html=f'<span>{_escape(fields["trend"])}</span>' if fields['trend'] else '',
+        tags_html=(
+            '<div class="tags">'
+            + ''.join(f'<span class="tag">{_escape(tag)}</span>' for tag in fields['tags'])
+            + '</div>'
+        ) if fields['tags'] else ''
+    )
+
+def render_cards(projects):
+    """Render every project's HTML and text card once.
+    
+    Returns {model_id: (html, text)}. Passing it to iter_email_chunks() and
+    get_plain_text() turns rendering any subset of the projects, such as a
+    segment's selection, into concatenation.
+    """
+    cards = {}
+    for project in projects:
+        fields = prepare_project(project)
+        cards[project['model_id']] = (render_card(fields), render_text_card(fields))
+    return cards
+
+def _card(project, cards, part):
+    if cards is not None:
+        return cards[project['model_id']][part]
+    fields = prepare_project(project)
+    return render_card(fields) if part == 0 else render_text_card(fields)
+
+def _sections(projects):
+    """Group projects by repo type, in order of first appearance.
+    
+    Returns None when every project is a model, so model-only digests keep
+    their single-list layout.
+    """
+    sections = {}
+    for project in projects:
+        sections.setdefault(project.get('repo_type', 'model'), []).append(project)
+    if set(sections) <= {'model'}:
+        return None
+    return sections
+
+def _subject(sections):
+    """Describe the repos in the digest, naming only the types it contains."""
+    if sections is None:
+        return "models among Hugging Face's most-downloaded models"
+    types = [repo_type for repo_type in SECTION_TITLES if repo_type in sections]
+    types += [repo_type for repo_type in sections if repo_type not in SECTION_TITLES]
+    names = [SECTION_PLURALS.get(repo_type, f"{repo_type}s") for repo_type in types]
+    if len(names) == 1:
+        return f"{names[0]} among Hugging Face's most popular {names[0]}"
+    return f"repos among Hugging Face's most popular {', '.join(names[:-1])} and {names[-1]}"
+
+def iter_email_chunks(projects, window=500, date=None, cards=None):
+    """Yield the HTML email in chunks, one card at a time.
+    
+    Digests that mix models, datasets and Spaces get one section per type.
+    Cards are taken from `cards` (see render_cards()) when given.
     """
+    if date is None:
+        date = datetime.now().strftime('%Y-%m-%d')
+    sections = _sections(projects)
+    yield _HEAD
+    yield _INTRO.format(window=window, date=date, subject=_subject(sections))
+    if sections is None:
+        for project in projects:
+            yield _card(project, cards, 0)
+    else:
+        for repo_type, section in sections.items():
+            yield _SECTION.format(title=SECTION_TITLES.get(repo_type, repo_type))
+            for project in section:
+                yield _card(project, cards, 0)
+    yield _FOOT
+
+def render_email(projects, out=None, window=500, date=None, cards=None):
+    """Render the HTML email.
     
-    return html
\ No newline at end of file
+    Writes to the file-like `out` if given, otherwise returns the document as
+    a string.
+    """
+    chunks = iter_email_chunks(projects, window, date, cards)
+    if out is None:
+        return ''.join(chunks)
+    for chunk in chunks:
+        out.write(chunk)
+
+def render_text_card(fields):
+    """Render one project for the plain-text part."""
+    lines = [f"{fields['title']} by {fields['author']}", fields['link']]
+    if fields['growth']:
+        lines.append(fields['growth'])
+    lines.append(fields['description'])
+    stats = [fields['likes']]
+    if fields['downloads']:
+        stats.append(f"{fields['downloads']} downloads")
+    stats.append(f"Updated: {fields['updated']}")
+    lines.append(' | '.join(stats))
+    if fields['trend']:
+        lines.append(fields['trend'])
+    return '\n'.join(lines) + '\n'
+
+def get_plain_text(projects, window=500, date=None, cards=None):
+    """Generate the plain-text alternative of the email."""
+    if date is None:
+        date = datetime.now().strftime('%Y-%m-%d')
+    sections = _sections(projects)
+    parts = [
+        f"Rising Stars in Top {window}\n",
+        f"The fastest-growing {_subject(sections)} as of {date}:\n"
+    ]
+    if sections is None:
+        parts.extend(_card(project, cards, 1) for project in projects)
+    else:
+        for repo_type, section in sections.items():
+            title = SECTION_TITLES.get(repo_type, repo_type)
+            parts.append(f"{title}\n{'=' * len(title)}\n")
+            parts.extend(_card(project, cards, 1) for project in section)
+    return '\n'.join(parts)
+
+def get_email_template(projects, window=500, cards=None):
+    """Generate the HTML email template with the given projects."""
+    return render_email(projects, window=window, cards=cards)
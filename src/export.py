@@ -0,0 +1,72 @@
+import csv
+import json
+from pathlib import Path
+
+from database import EXPORT_TABLES
+
+FORMATS = ('csv', 'jsonl', 'parquet')
+
+def infer_format(path):
+    """Export format from a file extension, defaulting to CSV."""
+    suffix = Path(path).suffix.lower().lstrip('.')
+    if suffix in ('jsonl', 'ndjson'):
+        return 'jsonl'
+    if suffix in ('parquet', 'pq'):
+        return 'parquet'
+    return 'csv'
+
+def write_csv(path, columns, chunks):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(name for name, _ in columns)
+        count = 0
+        for rows in chunks:
+            writer.writerows(rows)
+            count += len(rows)
+    return count
+
+def write_jsonl(path, columns, chunks):
+    names = [name for name, _ in columns]
+    with open(path, 'w') as f:
+        count = 0
+        for rows in chunks:
+            f.writelines(json.dumps(dict(zip(names, row)), ensure_ascii=False) + '\n' for row in rows)
+            count += len(rows)
+    return count
+
+def write_parquet(path, columns, chunks):
+    """Write one Parquet row group per chunk. Needs pyarrow."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError("Parquet export requires pyarrow (pip install pyarrow)")
+
+    types = {'text': pa.string(), 'integer': pa.int64()}
+    schema = pa.schema([(name, types[kind]) for name, kind in columns])
+    count = 0
+    with pq.ParquetWriter(str(path), schema) as writer:
+        for rows in chunks:
+            arrays = [pa.array(values, type=field.type)
+                      for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+    'parquet': write_parquet
+}
+
+def export_table(db, output_path, fmt=None, table='highlights', since=None):
+    """Stream a database table to a CSV, JSONL or Parquet file.
+
+    table is 'highlights' (highlighted models) or 'snapshots' (the listing
+    history). Returns the number of rows written.
+    """
+    fmt = fmt or infer_format(output_path)
+    if fmt not in WRITERS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    _, columns, _, _ = EXPORT_TABLES[table]
+    return WRITERS[fmt](output_path, columns, db.iter_export_rows(table, since))
@@ -1,8 +1,78 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import os
+import queue
 from pathlib import Path
 from datetime import datetime
 
-def setup_logger(log_dir="logs"):
+from metrics import current_stage, get_metrics
+
+DEFAULT_BACKUP_COUNT = 14  # Rotated files to keep
+
+_listener = None
+_queue_handler = None
+
+class ContextFilter(logging.Filter):
+    """Tag records with the current run id and pipeline stage."""
+
+    def filter(self, record):
+        record.run_id = get_metrics().run_id
+        record.stage = current_stage()
+        return True
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Enqueue records with the traceback kept apart from the message."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        # Args and exc_info may not be picklable or safe to read later
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(),
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'run_id': getattr(record, 'run_id', None),
+            'stage': getattr(record, 'stage', None),
+            'thread': record.threadName
+        }
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False)
+
+def setup_logger(log_dir="logs", json_format=None, max_bytes=None, backup_count=None):
+    """Configure the hf_newsletter logger and return it.
+    
+    Records are put on a queue and written by a background QueueListener, so
+    logging never blocks on disk or console I/O. The log file rotates at
+    midnight, or at max_bytes if set (LOG_MAX_BYTES), keeping backup_count old
+    files (LOG_BACKUP_COUNT, default 14). json_format (LOG_FORMAT=json) writes
+    the file as JSON lines carrying the run id and stage.
+    
+    Safe to call more than once: a repeated call replaces the previous
+    configuration instead of adding handlers.
+    """
+    global _listener, _queue_handler
+    if json_format is None:
+        json_format = os.getenv('LOG_FORMAT', 'text').lower() == 'json'
+    if max_bytes is None:
+        max_bytes = int(os.getenv('LOG_MAX_BYTES', 0))
+    if backup_count is None:
+        backup_count = int(os.getenv('LOG_BACKUP_COUNT', DEFAULT_BACKUP_COUNT))
+    
     # Create logs directory if it doesn't exist
     log_path = Path(log_dir)
     log_path.mkdir(exist_ok=True)
@@ -10,19 +80,47 @@ def setup_logger(log_dir="logs"):
     # Create a logger
     logger = logging.getLogger('hf_newsletter')
     logger.setLevel(logging.INFO)
+    shutdown_logger()
     
     # Create handlers
-    log_file = log_path / f"newsletter_{datetime.now().strftime('%Y%m%d')}.log"
-    file_handler = logging.FileHandler(log_file)
+    log_file = log_path / "newsletter.log"
+    if max_bytes:
+        file_handler = logging.handlers.RotatingFileHandler(
+            log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+        )
+    else:
+        file_handler = logging.handlers.TimedRotatingFileHandler(
+            log_file, when='midnight', backupCount=backup_count, encoding='utf-8'
+        )
     console_handler = logging.StreamHandler()
     
     # Create formatters and add it to handlers
     log_format = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(log_format)
+    file_handler.setFormatter(JsonFormatter() if json_format else log_format)
     console_handler.setFormatter(log_format)
     
-    # Add handlers to the logger
-    logger.addHandler(file_handler)
-    logger.addHandler(console_handler)
+    # Handlers run on the listener's thread; the queue handler only enqueues
+    log_queue = queue.SimpleQueue()
+    _queue_handler = _QueueHandler(log_queue)
+    _queue_handler.addFilter(ContextFilter())
+    logger.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(
+        log_queue, file_handler, console_handler, respect_handler_level=True
+    )
+    _listener.start()
     
-    return logger
\ No newline at end of file
+    return logger
+
+def shutdown_logger():
+    """Flush queued records and close the handlers set up by setup_logger()."""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger('hf_newsletter').removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+atexit.register(shutdown_logger)
\ No newline at end of file
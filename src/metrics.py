@@ -0,0 +1,125 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+class RunMetrics:
+    """Timing spans and counters for one newsletter run.
+
+    Spans accumulate wall-clock time per stage name, counters accumulate
+    integers (API calls, SQL statements, ...), and gauges hold the last value
+    set. Everything is thread-safe so worker threads can record too.
+    """
+
+    def __init__(self, run_id=None):
+        self.run_id = run_id or datetime.now().strftime('%Y%m%dT%H%M%S')
+        self.started_at = time.time()
+        self.finished_at = None
+        self.success = None
+        self.spans = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        stack = _stage_stack()
+        stack.append(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stack.pop()
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                span = self.spans.setdefault(name, {'seconds': 0.0, 'count': 0})
+                span['seconds'] += elapsed
+                span['count'] += 1
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def gauge(self, name, value):
+        with self._lock:
+            self.gauges[name] = value
+
+    def finish(self, success):
+        self.finished_at = time.time()
+        self.success = success
+
+    def summary(self):
+        with self._lock:
+            finished_at = self.finished_at or time.time()
+            return {
+                'run_id': self.run_id,
+                'started_at': datetime.fromtimestamp(self.started_at).isoformat(),
+                'duration_seconds': finished_at - self.started_at,
+                'success': self.success,
+                'stages': {name: dict(span) for name, span in self.spans.items()},
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges)
+            }
+
+    def write_json(self, path):
+        _atomic_write(path, json.dumps(self.summary(), indent=2))
+
+    def write_prometheus(self, path, prefix='hf_newsletter'):
+        """Write the run in the node_exporter textfile collector format."""
+        summary = self.summary()
+        lines = [
+            f"# HELP {prefix}_last_run_timestamp_seconds Start time of the last run.",
+            f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+            f"{prefix}_last_run_timestamp_seconds {self.started_at:.3f}",
+            f"# HELP {prefix}_last_run_duration_seconds Wall-clock duration of the last run.",
+            f"# TYPE {prefix}_last_run_duration_seconds gauge",
+            f"{prefix}_last_run_duration_seconds {summary['duration_seconds']:.6f}",
+            f"# HELP {prefix}_last_run_success Whether the last run succeeded.",
+            f"# TYPE {prefix}_last_run_success gauge",
+            f"{prefix}_last_run_success {1 if summary['success'] else 0}",
+            f"# HELP {prefix}_stage_seconds Time spent in each stage of the last run.",
+            f"# TYPE {prefix}_stage_seconds gauge"
+        ]
+        for name, span in sorted(summary['stages'].items()):
+            lines.append(f'{prefix}_stage_seconds{{stage="{name}"}} {span["seconds"]:.6f}')
+        lines += [
+            f"# HELP {prefix}_run_events Events counted during the last run.",
+            f"# TYPE {prefix}_run_events gauge"
+        ]
+        for name, value in sorted({**summary['counters'], **summary['gauges']}.items()):
+            lines.append(f'{prefix}_run_events{{name="{name}"}} {value}')
+        _atomic_write(path, '\n'.join(lines) + '\n')
+
+def _atomic_write(path, content):
+    # Write then rename so collectors never read a half-written file
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+_stages = threading.local()
+
+def _stage_stack():
+    stack = getattr(_stages, 'stack', None)
+    if stack is None:
+        stack = _stages.stack = []
+    return stack
+
+def current_stage():
+    """Name of the innermost span open on this thread, or None."""
+    stack = _stage_stack()
+    return stack[-1] if stack else None
+
+_current = RunMetrics()
+
+def start_run(run_id=None):
+    """Start collecting metrics for a new run and return its RunMetrics."""
+    global _current
+    _current = RunMetrics(run_id)
+    return _current
+
+def get_metrics():
+    """The RunMetrics of the current run."""
+    return _current
@@ -1,123 +1,465 @@
 import os
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from pathlib import Path
-from postmarker.core import PostmarkClient
-from dotenv import load_dotenv
 from huggingface_hub import HfApi
 from database import Database
-from email_template import get_email_template
+from cache import CachedHfApi
+from scoring import score_candidates, top_k
+from delivery import load_environment
+from metrics import get_metrics
+from segments import group_recipients
+from email_template import get_email_template, get_plain_text, render_cards, render_email
 
-def fetch_trending_projects(db):
+logger = logging.getLogger('hf_newsletter')
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_TIMEOUT = 10.0
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF = 1.0
+MAX_RETRY_DELAY = 30.0  # Longest wait before a retry; a longer Retry-After fails the lookup
+DEFAULT_LIMIT = 10
+DEFAULT_WINDOW = 500
+DEFAULT_REPO_TYPES = 'model,dataset,space'
+
+# How each kind of repo is listed and looked up. Datasets and Spaces are
+# stored under their URL prefix, so their ids never collide with models'.
+# Spaces have no download counts and are ranked by likes instead.
+REPO_TYPES = {
+    'model': {'list': 'list_models', 'info': 'model_info', 'sort': 'downloads', 'prefix': ''},
+    'dataset': {'list': 'list_datasets', 'info': 'dataset_info', 'sort': 'downloads',
+                'prefix': 'datasets/'},
+    'space': {'list': 'list_spaces', 'info': 'space_info', 'sort': 'likes', 'prefix': 'spaces/'}
+}
+
+def _retry_after(error, attempt, backoff, max_delay=MAX_RETRY_DELAY):
+    """Return seconds to wait before retrying, or None if the error is not retryable.
+    
+    Backoff is capped at max_delay. A server asking for a longer wait is not
+    retried, so one throttled lookup cannot hold up the whole run.
+    """
+    response = getattr(error, 'response', None)
+    status = getattr(response, 'status_code', None)
+    if status != 429 and (status is None or status < 500):
+        return None
+    
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = headers.get('Retry-After')
+    if retry_after:
+        try:
+            delay = max(0.0, float(retry_after))
+        except ValueError:
+            pass
+        else:
+            if delay > max_delay:
+                logger.warning(f"Server asked to retry after {delay:.0f}s, longer than {max_delay:.0f}s")
+                return None
+            return delay
+    return min(backoff * (2 ** attempt), max_delay)
+
+def fetch_model_info(api, model_id, timeout=DEFAULT_TIMEOUT,
+                     max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF, repo_type='model'):
+    """Fetch model (or dataset/Space) info, backing off on 429/5xx responses."""
+    run_metrics = get_metrics()
+    fetch_info = getattr(api, REPO_TYPES[repo_type]['info'])
+    attempt = 0
+    while True:
+        try:
+            run_metrics.incr('hf_api_calls')
+            return fetch_info(model_id, timeout=timeout)
+        except Exception as e:
+            delay = _retry_after(e, attempt, backoff)
+            if delay is None or attempt >= max_retries:
+                run_metrics.incr('hf_api_errors')
+                raise
+            run_metrics.incr('hf_api_retries')
+            logger.warning(f"Throttled fetching {model_id}, retrying in {delay:.1f}s")
+            time.sleep(delay)
+            attempt += 1
+
+def enrich_models(api, model_ids, max_workers=None, timeout=DEFAULT_TIMEOUT,
+                  max_retries=DEFAULT_MAX_RETRIES, backoff=DEFAULT_BACKOFF, on_result=None,
+                  repo_type='model'):
+    """Fetch model info for many models concurrently.
+    
+    Returns a list aligned with model_ids; failed lookups are None. If given,
+    on_result(model_id, model_info) is called on the calling thread as each
+    lookup finishes, e.g. to checkpoint progress.
+    """
+    if max_workers is None:
+        max_workers = int(os.getenv('HF_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    
+    def fetch(model_id):
+        try:
+            return fetch_model_info(api, model_id, timeout, max_retries, backoff, repo_type)
+        except Exception as e:
+            logger.warning(f"Error processing {model_id}: {str(e)}")
+            return None
+    
+    if not model_ids:
+        return []
+    
+    results = [None] * len(model_ids)
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        futures = {executor.submit(fetch, model_id): i for i, model_id in enumerate(model_ids)}
+        for future in as_completed(futures):
+            # Results are placed by index, keeping output deterministic
+            i = futures[future]
+            results[i] = future.result()
+            if on_result is not None:
+                on_result(model_ids[i], results[i])
+    return results
+
+def get_description(model_info):
+    """Extract a description from a model's card data."""
+    if model_info is None:
+        return "No description available"
+    card_data = getattr(model_info, 'cardData', None) or getattr(model_info, 'card_data', None) or {}
+    return card_data.get('model-description', "No description available")
+
+def model_details(model_info):
+    """The fields of a model_info response that end up in the newsletter."""
+    last_modified = getattr(model_info, 'lastModified', None) or getattr(model_info, 'last_modified', None)
+    if isinstance(last_modified, datetime):
+        last_modified = last_modified.isoformat()
+    return {
+        'description': get_description(model_info),
+        'last_modified': last_modified
+    }
+
+def format_growth(metrics, window=DEFAULT_WINDOW):
+    """Format growth metrics for display.
+    
+    Expects the weekly growth rates added by score_models().
+    """
+    growth_info = []
+    if metrics['is_new']:
+        growth_info.append(f"🆕 New to Top {window}")
+    else:
+        if metrics['likes_growth']:
+            weekly_growth = metrics['weekly_likes_growth'] * 100
+            if weekly_growth > 25:  # Show if more than 25% weekly growth
+                growth_info.append(f"⭐ {weekly_growth:.0f}% likes/week")
+        
+        if metrics['downloads_growth']:
+            weekly_growth = metrics['weekly_downloads_growth'] * 100
+            if weekly_growth > 50:  # Show if more than 50% weekly growth
+                growth_info.append(f"📈 {weekly_growth:.0f}% downloads/week")
+    
+    return " | ".join(growth_info) if growth_info else ""
+
+def create_api(cache=None):
+    """Create an HfApi client, optionally backed by a ResponseCache."""
     api = HfApi()
+    if cache is not None:
+        api = CachedHfApi(api, cache)
+    return api
+
+class ModelRecord:
+    """Compact view of a listed repo holding only the fields the pipeline uses.
+    
+    model_id carries the repo type's URL prefix (e.g. datasets/org/name);
+    repo_id is the bare id the Hub API expects.
+    """
     
-    # Fetch top models by downloads
-    popular_models = api.list_models(
-        sort="downloads",
+    __slots__ = ('model_id', 'author', 'likes', 'downloads', 'last_modified', 'tags', 'sha',
+                 'repo_type')
+    
+    def __init__(self, model_id, author, likes, downloads, last_modified=None, tags=(), sha=None,
+                 repo_type='model'):
+        self.model_id = model_id
+        self.author = author
+        self.likes = likes
+        self.downloads = downloads
+        self.last_modified = last_modified
+        self.tags = tags
+        self.sha = sha
+        self.repo_type = repo_type
+    
+    @property
+    def repo_id(self):
+        return self.model_id[len(REPO_TYPES[self.repo_type]['prefix']):]
+    
+    @classmethod
+    def from_info(cls, info, repo_type='model'):
+        repo_id = getattr(info, 'modelId', None) or info.id
+        author = getattr(info, 'author', None)
+        if author is None and '/' in repo_id:
+            # Lean listings don't include the author, but it's the id's namespace
+            author = repo_id.split('/', 1)[0]
+        return cls(
+            REPO_TYPES[repo_type]['prefix'] + repo_id,
+            author,
+            getattr(info, 'likes', 0) or 0,
+            getattr(info, 'downloads', 0) or 0,
+            getattr(info, 'lastModified', None) or getattr(info, 'last_modified', None),
+            tuple(getattr(info, 'tags', None) or ()),
+            getattr(info, 'sha', None),
+            repo_type
+        )
+    
+    def to_row(self):
+        """JSON-serialisable form, for run checkpoints."""
+        last_modified = self.last_modified
+        if isinstance(last_modified, datetime):
+            last_modified = last_modified.isoformat()
+        return [self.model_id, self.author, self.likes, self.downloads, last_modified,
+                list(self.tags), self.sha, self.repo_type]
+    
+    @classmethod
+    def from_row(cls, row):
+        model_id, author, likes, downloads, last_modified, tags, sha, repo_type = row
+        return cls(model_id, author, likes, downloads, last_modified, tuple(tags), sha, repo_type)
+
+def get_window():
+    """Number of top models to scan, from HF_WINDOW (default 500)."""
+    return int(os.getenv('HF_WINDOW', DEFAULT_WINDOW))
+
+def get_repo_types():
+    """Repo types to feature, from HF_REPO_TYPES (default: all three)."""
+    repo_types = [name.strip() for name in os.getenv('HF_REPO_TYPES', DEFAULT_REPO_TYPES).split(',')]
+    unknown = [name for name in repo_types if name not in REPO_TYPES]
+    if unknown:
+        raise ValueError(f"Unknown repo type(s) in HF_REPO_TYPES: {', '.join(unknown)}")
+    return repo_types
+
+def list_popular(api, repo_type='model', window=None, lean=False):
+    """Lazily list the most popular repos of one type as ModelRecords.
+    
+    Lean listings skip the full payload (siblings, card data, ...). They
+    don't include lastModified either, so growth for those repos is measured
+    from when they were last highlighted.
+    """
+    if window is None:
+        window = get_window()
+    spec = REPO_TYPES[repo_type]
+    repos = getattr(api, spec['list'])(
+        sort=spec['sort'],
         direction=-1,
-        limit=500,  # Look at top 500 models
-        full=True
+        limit=window,
+        full=not lean
     )
+    return (ModelRecord.from_info(repo, repo_type) for repo in repos)
+
+def list_popular_models(api, window=None, lean=False):
+    """Lazily list the most-downloaded models as ModelRecords."""
+    return list_popular(api, 'model', window, lean)
+
+def score_models(db, models, repo_type='model'):
+    """Score every listed model in one pass.
     
-    # Convert generator to list for processing
-    all_models = list(popular_models)
-    
-    trending_projects = []
-    for model in all_models:
-        # Calculate growth metrics
-        metrics = db.calculate_growth_metrics(
-            model.modelId,
-            model.lastModified,
-            model.likes,
-            getattr(model, 'downloads', 0)
-        )
+    Returns the per-model growth metrics and the score arrays from
+    scoring.score_candidates, both in listing order.
+    """
+    all_metrics = db.calculate_growth_metrics_bulk(
+        (model.model_id, model.last_modified, model.likes, model.downloads)
+        for model in models
+    )
+    previous = [metrics['previous_record'] for metrics in all_metrics]
+    scores = score_candidates(
+        likes=[model.likes for model in models],
+        # Spaces have no download counts
+        downloads=[model.downloads for model in models] if repo_type != 'space' else None,
+        prev_likes=[record[4] if record else 0 for record in previous],
+        prev_downloads=[record[5] if record else 0 for record in previous],
+        days=[metrics['days_since_update'] for metrics in all_metrics],
+        is_new=[metrics['is_new'] for metrics in all_metrics]
+    )
+    return all_metrics, scores
+
+def build_project(model, metrics, details=None, trend=None, window=DEFAULT_WINDOW):
+    """Newsletter entry for a model; details come from model_details()."""
+    details = details or {}
+    last_modified = model.last_modified
+    if last_modified is None:
+        last_modified = details.get('last_modified')
+    return {
+        'title': model.repo_id,
+        'author': model.author,
+        'description': details.get('description', "No description available"),
+        'growth': format_growth(metrics, window),
+        'trend': trend,
+        'likes': f"{model.likes} ❤️",
+        'link': f"https://huggingface.co/{model.model_id}",
+        'tags': list(model.tags),
+        'downloads': model.downloads,
+        'last_modified': last_modified,
+        # Additional data for database
+        'model_id': model.model_id,
+        'likes_count': model.likes,
+        'repo_type': model.repo_type
+    }
+
+def fetch_trending_projects(db, api=None, max_workers=None, limit=None, snapshot=True,
+                            window=None, lean=False, run_id=None, repo_types=None):
+    """Select the `limit` best-scoring repos of each type and fetch their details.
+    
+    Each repo type (models, datasets, Spaces) runs its own list/score/enrich
+    pipeline, and the pipelines run concurrently, so the fetch takes about as
+    long as the slowest one. Only the selected repos are enriched. When
+    snapshot is True every listing is stored in the snapshot table so
+    long-term trends can be computed. Highlights are not written here; they
+    are committed by Database.complete_edition() once the edition's outbox
+    confirms delivery (see outbox.queue_edition()).
+    
+    With a run_id (see Database.resume_run) the listings, the scored
+    selections and each repo's details are checkpointed as they complete, and
+    a resumed run picks up after its last checkpoint instead of calling the
+    Hub again.
+    
+    Returns the projects grouped by repo type, in repo_types order.
+    """
+    if api is None:
+        api = HfApi()
+    if limit is None:
+        limit = int(os.getenv('NEWSLETTER_LIMIT', DEFAULT_LIMIT))
+    if window is None:
+        window = get_window()
+    if repo_types is None:
+        repo_types = get_repo_types()
+    
+    run_metrics = get_metrics()
+    run = db.get_run(run_id) if run_id is not None else None
+    if run is not None and run['stage'] != 'started':
+        logger.info(f"Resuming run {run_id} after stage '{run['stage']}'")
+        run_metrics.incr('runs_resumed')
+    
+    # One snapshot timestamp for all repo types. A resumed run reuses its
+    # start time, so its snapshot rows are overwritten rather than duplicated.
+    ts = run['started_ts'] if run is not None else int(time.time())
+    
+    def fetch(repo_type):
+        return _fetch_repo_type(db, api, repo_type, run, ts, max_workers, limit,
+                                snapshot, window, lean)
+    
+    with ThreadPoolExecutor(max_workers=max(1, len(repo_types))) as executor:
+        results = list(executor.map(fetch, repo_types))
+    
+    if snapshot:
+        with run_metrics.span('snapshot'):
+            db.prune_snapshots()
+    if run_id is not None:
+        db.checkpoint_run(run_id, 'enriched')
+    
+    return [project for projects in results for project in projects]
+
+def _fetch_repo_type(db, api, repo_type, run, ts, max_workers, limit, snapshot, window, lean):
+    """The list/score/enrich pipeline for one repo type."""
+    run_metrics = get_metrics()
+    run_id = run['id'] if run is not None else None
+    
+    stored_listing = run['listing'].get(repo_type) if run is not None else None
+    if stored_listing is not None:
+        models = [ModelRecord.from_row(row) for row in stored_listing]
+    else:
+        with run_metrics.span('listing'):
+            run_metrics.incr('hf_api_calls')
+            models = list(list_popular(api, repo_type, window, lean))
+        if run_id is not None:
+            db.checkpoint_run(run_id, 'listed', repo_type,
+                              listing=[model.to_row() for model in models])
+    run_metrics.incr('models_listed', len(models))
+    
+    stored_selection = run['selected'].get(repo_type) if run is not None else None
+    if stored_selection is not None:
+        selected = [(models[i], metrics, trend) for i, metrics, trend in stored_selection]
+    else:
+        trends = {}
+        if snapshot:
+            with run_metrics.span('snapshot'):
+                db.record_snapshots(
+                    ((model.model_id, model.likes, model.downloads, rank)
+                     for rank, model in enumerate(models, 1)),
+                    ts=ts, repo_type=repo_type
+                )
+                trends = db.get_snapshot_growth(ts=ts, repo_type=repo_type)
         
-        # Check if model is worth featuring
-        if db.is_model_worth_featuring(metrics):
-            try:
-                # Get the model description from Hugging Face
-                model_info = api.model_info(model.modelId)
-                card_data = getattr(model_info, 'cardData', {}) or {}
-                description = card_data.get('model-description', "No description available")
-                
-                # Format growth metrics for display
-                growth_info = []
-                if metrics['is_new']:
-                    growth_info.append("🆕 New to Top 500")
-                else:
-                    days = max(1, metrics['days_since_update'])
-                    weeks = max(1, days / 7)
-                    
-                    if metrics['likes_growth']:
-                        weekly_growth = (metrics['likes_growth'] / weeks) * 100
-                        if weekly_growth > 25:  # Show if more than 25% weekly growth
-                            growth_info.append(f"⭐ {weekly_growth:.0f}% likes/week")
-                    
-                    if metrics['downloads_growth']:
-                        weekly_growth = (metrics['downloads_growth'] / weeks) * 100
-                        if weekly_growth > 50:  # Show if more than 50% weekly growth
-                            growth_info.append(f"📈 {weekly_growth:.0f}% downloads/week")
-                
-                growth_text = " | ".join(growth_info) if growth_info else ""
-                
-            except Exception as e:
-                print(f"Error processing {model.modelId}: {str(e)}")
-                description = "No description available"
-                growth_text = ""
-            
-            project_data = {
-                'title': model.modelId,
-                'author': model.author,
-                'description': description,
-                'growth': growth_text,
-                'likes': f"{model.likes} ❤️",
-                'link': f"https://huggingface.co/{model.modelId}",
-                'tags': getattr(model, 'tags', []),
-                'downloads': getattr(model, 'downloads', 0),
-                'last_modified': model.lastModified,
-                # Additional data for database
-                'model_id': model.modelId,
-                'likes_count': model.likes
-            }
-            trending_projects.append(project_data)
-            
-            # Update database
-            db.update_highlighted_model({
-                'model_id': model.modelId,
-                'author': model.author,
-                'last_modified': model.lastModified,
-                'likes': model.likes,
-                'downloads': getattr(model, 'downloads', 0)
-            })
-    
-    return trending_projects[:10]  # Return top 10 trending projects
-
-def create_email_content(projects):
-    return get_email_template(projects)
-
-def send_email(recipient_email, html_content):
-    load_dotenv()
-    
-    postmark_token = os.getenv('POSTMARK_TOKEN')
-    if not postmark_token:
-        raise ValueError("POSTMARK_TOKEN not found in environment variables")
-    
-    sender_email = os.getenv('SENDER_EMAIL', 'newsletter@openhands.dev')
+        # Rank the whole listing by growth score and keep the best `limit`
+        with run_metrics.span('scoring'):
+            all_metrics, scores = score_models(db, models, repo_type)
+            indices = top_k(scores['score'], scores['worthy'], limit)
+            selected = []
+            for i in indices:
+                metrics = all_metrics[i]
+                metrics['weekly_likes_growth'] = float(scores['weekly_likes_growth'][i])
+                metrics['weekly_downloads_growth'] = float(scores['weekly_downloads_growth'][i])
+                metrics['score'] = float(scores['score'][i])
+                selected.append((models[i], metrics, trends.get(models[i].model_id)))
+        run_metrics.incr('models_worthy', int(scores['worthy'].sum()))
+        if run_id is not None:
+            db.checkpoint_run(run_id, 'scored', repo_type, selected=[
+                [int(i), {key: value for key, value in metrics.items() if key != 'previous_record'}, trend]
+                for i, (_, metrics, trend) in zip(indices, selected)
+            ])
     
-    if not recipient_email:
-        recipient_email = os.getenv('RECIPIENT_EMAIL')
-        if not recipient_email:
-            raise ValueError("No recipient email provided")
-    
-    # Initialize Postmark client
-    postmark = PostmarkClient(server_token=postmark_token)
-    
-    # Send email using Postmark
-    response = postmark.emails.send(
-        From=sender_email,
-        To=recipient_email,
-        Subject='🤗 Rising Stars in Hugging Face Top 500',
-        HtmlBody=html_content,
-        MessageStream='outbound'  # Default stream
-    )
+    details = db.get_run_enrichment(run_id) if run_id is not None else {}
+    model_ids = {model.repo_id: model.model_id for model, _, _ in selected}
+    
+    def record(repo_id, model_info):
+        if model_info is not None:
+            model_id = model_ids[repo_id]
+            details[model_id] = model_details(model_info)
+            if run_id is not None:
+                db.record_enrichment(run_id, model_id, details[model_id])
     
-    return response
\ No newline at end of file
+    remaining = [model.repo_id for model, _, _ in selected if model.model_id not in details]
+    if remaining:
+        with run_metrics.span('enrichment'):
+            enrich_models(api, remaining, max_workers=max_workers, on_result=record,
+                          repo_type=repo_type)
+    
+    return [
+        build_project(model, metrics, details.get(model.model_id), trend, window)
+        for model, metrics, trend in selected
+    ]
+
+def create_email_content(projects, window=None, cards=None):
+    if window is None:
+        window = get_window()
+    return get_email_template(projects, window, cards)
+
+def create_text_content(projects, window=None, cards=None):
+    if window is None:
+        window = get_window()
+    return get_plain_text(projects, window, cards=cards)
+
+def create_variants(db, projects, recipients, window=None, cards=None):
+    """Render the segment variants of an edition.
+    
+    Subscribers in a segment get only the projects that match it. Each
+    variant is concatenated from `cards` (see render_cards()), so hundreds of
+    segments cost about one render. Returns (recipients of the full edition,
+    variants) for queue_edition().
+    """
+    if window is None:
+        window = get_window()
+    if cards is None:
+        cards = render_cards(projects)
+    full, variants, skipped = group_recipients(
+        projects, recipients, db.get_subscriber_segments(), db.get_segments()
+    )
+    if skipped:
+        logger.info(f"Skipping {skipped} subscriber(s) whose segment matches nothing in this edition")
+    date = datetime.now().strftime('%Y-%m-%d')
+    for variant in variants:
+        variant['html'] = render_email(variant['projects'], window=window, date=date, cards=cards)
+        variant['text'] = get_plain_text(variant['projects'], window, date, cards)
+    return full, variants
+
+def get_subject(window=None):
+    return f'🤗 Rising Stars in Hugging Face Top {window or get_window()}'
+
+def get_recipients(db, recipient_email=None):
+    """Recipients for an edition: the override, else subscribers, else RECIPIENT_EMAIL."""
+    if recipient_email:
+        return [recipient_email]
+    subscribers = db.get_active_subscribers()
+    if subscribers:
+        return subscribers
+    load_environment()
+    recipient_email = os.getenv('RECIPIENT_EMAIL')
+    if not recipient_email:
+        raise ValueError("No recipient email provided")
+    return [recipient_email]
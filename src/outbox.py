@@ -0,0 +1,122 @@
+import logging
+import time
+
+from delivery import (
+    BATCH_SIZE, TRANSPORT_ERROR, build_message, deliver, get_postmark_client, get_sender
+)
+
+logger = logging.getLogger('hf_newsletter')
+
+# Give up on a recipient after this many transport failures
+MAX_ATTEMPTS = 5
+
+def highlight_records(projects):
+    """Database records for the models featured in projects."""
+    return [{
+        'model_id': project['model_id'],
+        'author': project['author'],
+        'last_modified': project['last_modified'],
+        'likes': project['likes_count'],
+        'downloads': project['downloads'],
+        'repo_type': project.get('repo_type', 'model')
+    } for project in projects]
+
+def queue_edition(db, projects, recipients, subject, html_content, text_content=None, run_id=None,
+                  variants=None):
+    """Store a rendered edition in the outbox. Returns its id.
+    
+    variants (see newsletter.create_variants()) are queued for their own
+    recipients. Only projects that someone receives are recorded as highlights.
+    """
+    featured = projects
+    if not recipients:
+        shown = {project['model_id'] for variant in variants or [] for project in variant['projects']}
+        featured = [project for project in projects if project['model_id'] in shown]
+    return db.create_edition(
+        subject, html_content, text_content, highlight_records(featured), recipients, run_id,
+        variants
+    )
+
+def drain_edition(db, edition_id, client=None, concurrency=None, chunk_size=None):
+    """Send every pending outbox row of an edition.
+
+    Rows are claimed before sending and updated from Postmark's per-message
+    responses, so an interrupted drain can be resumed by calling this again.
+    Each message carries its idempotency key in the Postmark metadata. Once
+    every row is resolved the edition is closed, which commits its highlights
+    if anyone received it.
+
+    Returns a summary dict with sent/failed counts for this drain, the
+    edition's unconfirmed count, throughput and the final edition status
+    (None while rows are still pending or unconfirmed).
+    """
+    edition = db.get_edition(edition_id)
+    if chunk_size is None:
+        chunk_size = BATCH_SIZE * 4
+    # Resolve the client and sender before claiming anything, so a missing
+    # token or sender fails the drain with every row still pending
+    if client is None:
+        client = get_postmark_client()
+    sender = get_sender()
+    # Segment variants are loaded once each, as their recipients come up
+    contents = {0: (edition['html'], edition['text'])}
+    totals = {'sent': 0, 'failed': 0, 'retried': 0, 'unconfirmed': 0}
+
+    start = time.perf_counter()
+    while True:
+        rows = db.claim_outbox(edition_id, chunk_size)
+        if not rows:
+            break
+
+        try:
+            for _, _, _, variant in rows:
+                if variant not in contents:
+                    contents[variant] = db.get_edition_variant(edition_id, variant)
+            messages = [
+                build_message(
+                    recipient, edition['subject'], *contents[variant], sender,
+                    metadata={'idempotency_key': key}
+                )
+                for recipient, key, _, variant in rows
+            ]
+            result = deliver(messages, client=client, concurrency=concurrency)
+        except Exception as e:
+            # deliver() reports failed Postmark calls in its results, so
+            # anything raised here happened before a request went out
+            db.update_outbox(edition_id, [
+                (recipient, 'pending', None, str(e)) for recipient, _, _, _ in rows
+            ])
+            raise
+
+        updates = []
+        for (recipient, _, attempts, _), response in zip(rows, result['results']):
+            error_code = response.get('ErrorCode')
+            if error_code == 0:
+                updates.append((recipient, 'sent', response.get('MessageID'), None))
+                totals['sent'] += 1
+            elif response.get('Unconfirmed'):
+                # Postmark may have sent it; leave it claimed rather than risk a duplicate
+                updates.append((recipient, 'sending', None, response.get('Message')))
+                totals['unconfirmed'] += 1
+            elif error_code == TRANSPORT_ERROR and attempts < MAX_ATTEMPTS:
+                updates.append((recipient, 'pending', None, response.get('Message')))
+                totals['retried'] += 1
+            else:
+                updates.append((recipient, 'failed', None, response.get('Message')))
+                totals['failed'] += 1
+        db.update_outbox(edition_id, updates)
+    elapsed = time.perf_counter() - start
+
+    # Rows still claimed were left unconfirmed by this drain or by one that
+    # died mid-send; either way they may or may not have been sent
+    totals['unconfirmed'] = db.get_outbox_counts(edition_id).get('sending', 0)
+    if totals['unconfirmed']:
+        logger.warning(
+            f"{totals['unconfirmed']} messages of edition {edition_id} may or may not have "
+            "been sent; check Postmark by idempotency_key metadata or rerun with --resend-unconfirmed"
+        )
+
+    totals['elapsed'] = elapsed
+    totals['rate'] = totals['sent'] / elapsed if elapsed > 0 else 0.0
+    totals['status'] = db.complete_edition(edition_id)
+    return totals
@@ -0,0 +1,169 @@
+import os
+
+# The fetch, render and deliver steps of an edition, shared by the CLI and
+# the daemon. Like cli.py, this module only imports the Hugging Face,
+# Postmark and NumPy stacks inside the functions that use them.
+
+def save_preview(html_content):
+    """Save HTML content to a temporary file and open in browser."""
+    import tempfile
+    with tempfile.NamedTemporaryFile('w', delete=False, suffix='.html') as f:
+        f.write(html_content)
+        return f.name
+
+def deliver_edition(db, edition_id, logger, concurrency=None, run_metrics=None):
+    """Drain an edition's outbox and log the outcome."""
+    from outbox import drain_edition
+    result = drain_edition(db, edition_id, concurrency=concurrency)
+    if run_metrics is not None:
+        run_metrics.incr('messages_sent', result['sent'])
+        run_metrics.incr('messages_failed', result['failed'])
+        run_metrics.incr('messages_unconfirmed', result['unconfirmed'])
+        run_metrics.gauge('messages_per_second', round(result['rate'], 3))
+    logger.info(
+        f"Edition {edition_id}: sent {result['sent']} emails in {result['elapsed']:.2f}s "
+        f"({result['rate']:.1f} messages/sec), {result['failed']} failed"
+    )
+    if result['unconfirmed']:
+        raise RuntimeError(
+            f"Edition {edition_id} has {result['unconfirmed']} unconfirmed message(s); "
+            "check Postmark, then rerun with --resend-unconfirmed"
+        )
+    if result['status'] != 'delivered':
+        raise RuntimeError(f"Edition {edition_id} could not be delivered")
+    return result
+
+def write_run_metrics(run_metrics, logs_path, logger):
+    """Write the run summary as JSON and as a Prometheus textfile."""
+    json_path = logs_path / f"run_{run_metrics.run_id}.json"
+    run_metrics.write_json(json_path)
+    run_metrics.write_prometheus(logs_path / "hf_newsletter.prom")
+    summary = run_metrics.summary()
+    stages = ', '.join(f"{name} {span['seconds']:.2f}s" for name, span in summary['stages'].items())
+    logger.info(f"Run {run_metrics.run_id} took {summary['duration_seconds']:.2f}s ({stages})")
+
+def open_cache(data_path):
+    """Open the on-disk Hugging Face response cache, sized by HF_CACHE_MAX_MB."""
+    from cache import ResponseCache, DEFAULT_MAX_BYTES
+    max_bytes = int(os.getenv('HF_CACHE_MAX_MB', DEFAULT_MAX_BYTES // (1024 * 1024))) * 1024 * 1024
+    return ResponseCache(data_path / "http_cache.db", max_bytes=max_bytes)
+
+def run_newsletter(db, args, logger, run_metrics, data_path, api=None):
+    """Fetch, render and deliver an edition (or open a preview).
+    
+    api is a long-lived Hugging Face client to reuse, as the daemon does;
+    without one, a client and response cache are created for this run.
+    Returns True when the run finished without anything left to do.
+    """
+    import webbrowser
+    from newsletter import (
+        fetch_trending_projects, create_email_content, create_text_content, create_variants,
+        create_api, get_window, get_subject, get_recipients, get_repo_types, render_cards
+    )
+    from outbox import queue_edition
+    
+    # Finish any edition an earlier run queued but did not deliver
+    # before fetching a new one
+    if not args.preview:
+        if args.resend_unconfirmed:
+            requeued = db.reset_unconfirmed()
+            logger.info(f"Requeued {requeued} unconfirmed message(s)")
+        pending_editions = db.get_pending_editions()
+        if pending_editions:
+            for edition_id in pending_editions:
+                logger.info(f"Resuming delivery of edition {edition_id}...")
+                with run_metrics.span('delivery'):
+                    deliver_edition(db, edition_id, logger, args.send_concurrency, run_metrics)
+            logger.info("Newsletter sent successfully!")
+            return True
+    
+    # Continue an interrupted run from its last checkpoint. Previews are not
+    # checkpointed.
+    window = args.window or get_window()
+    repo_types = args.repo_types or get_repo_types()
+    run_id = None
+    if not args.preview:
+        if args.no_resume:
+            db.abandon_runs()
+        run_id = db.resume_run({
+            'window': window, 'limit': args.limit, 'lean': args.lean, 'repo_types': repo_types
+        })
+    
+    # Fetch projects
+    logger.info("Fetching trending projects...")
+    own_api = api is None
+    if own_api:
+        cache = None if args.no_cache else open_cache(data_path)
+        api = create_api(cache)
+    else:
+        cache = getattr(api, 'cache', None)
+    # A shared cache counts across runs, so report this run's share
+    hits, misses = (cache.hits, cache.misses) if cache is not None else (0, 0)
+    try:
+        with run_metrics.span('fetch'):
+            projects = fetch_trending_projects(
+                db, api=api, max_workers=args.workers, limit=args.limit,
+                # Previews leave no trace, so they record no snapshots
+                snapshot=not args.preview, window=window, lean=args.lean, run_id=run_id,
+                repo_types=repo_types
+            )
+        run_metrics.gauge('projects_featured', len(projects))
+        
+        if cache is not None:
+            hits, misses = cache.hits - hits, cache.misses - misses
+            run_metrics.incr('cache_hits', hits)
+            run_metrics.incr('cache_misses', misses)
+            logger.info(f"Response cache: {hits} hits, {misses} misses")
+    finally:
+        if own_api and cache is not None:
+            cache.close()
+    
+    if not projects:
+        logger.info("No new or updated projects found")
+        if run_id is not None:
+            db.finish_run(run_id)
+        return True
+    
+    logger.info(f"Found {len(projects)} new or updated projects")
+    
+    # Create newsletter content
+    logger.info("Creating email content...")
+    with run_metrics.span('render'):
+        # Cards are rendered once and shared by the full edition and every
+        # segment variant
+        cards = render_cards(projects)
+        html_content = create_email_content(projects, window, cards)
+    
+    if args.preview:
+        preview_path = save_preview(html_content)
+        logger.info(f"Opening preview in browser...")
+        webbrowser.open(f'file://{preview_path}')
+        return True
+    
+    # Queue the rendered edition, then deliver it. Highlights are
+    # committed once the outbox confirms delivery.
+    with run_metrics.span('render'):
+        text_content = create_text_content(projects, window, cards)
+    recipients = get_recipients(db, args.recipient)
+    variants = None
+    if not args.recipient:
+        with run_metrics.span('render'):
+            recipients, variants = create_variants(db, projects, recipients, window, cards)
+        if not recipients and not variants:
+            logger.info("No subscriber's segment matches this edition; nothing to send")
+            if run_id is not None:
+                db.finish_run(run_id)
+            return True
+    with run_metrics.span('queue'):
+        edition_id = queue_edition(
+            db, projects, recipients, get_subject(window), html_content, text_content, run_id,
+            variants
+        )
+    total = len(recipients) + sum(len(variant['recipients']) for variant in variants or [])
+    segmented = f" ({len(variants)} segment variant(s))" if variants else ""
+    logger.info(f"Sending edition {edition_id} to {total} recipient(s){segmented}...")
+    with run_metrics.span('delivery'):
+        deliver_edition(db, edition_id, logger, args.send_concurrency, run_metrics)
+    
+    logger.info("Newsletter sent successfully!")
+    return True
@@ -0,0 +1,81 @@
+import numpy as np
+
+# Thresholds mirror Database.is_model_worth_featuring
+COOLDOWN_DAYS = 14
+WEEKLY_LIKES_GROWTH = 0.25  # 25% weekly growth in likes
+WEEKLY_DOWNLOADS_GROWTH = 0.50  # 50% weekly growth in downloads
+TOTAL_LIKES_GROWTH = 2.0  # 200% total growth in likes
+TOTAL_DOWNLOADS_GROWTH = 5.0  # 500% total growth in downloads
+
+# Models new to the listing always lead, in listing (download) order
+NEW_MODEL_SCORE = np.inf
+
+def _growth(current, previous):
+    """Relative growth, infinite when there is no previous value to compare with."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(previous > 0, (current - previous) / np.where(previous > 0, previous, 1), np.inf)
+
+def growth_metrics(likes, downloads, prev_likes, prev_downloads, days):
+    """Total and weekly growth of likes and downloads since the previous record.
+
+    Pass downloads=None for repos without download counts (Spaces); their
+    download growth is then zero. Returns a dict of arrays:
+
+    - likes_growth / downloads_growth: total growth since the previous record
+    - weekly_likes_growth / weekly_downloads_growth: growth per week
+    """
+    likes = np.asarray(likes, dtype=np.float64)
+    prev_likes = np.asarray(prev_likes, dtype=np.float64)
+    days = np.asarray(days, dtype=np.float64)
+
+    likes_growth = _growth(likes, prev_likes)
+    if downloads is None:
+        downloads_growth = np.zeros_like(likes_growth)
+    else:
+        downloads = np.asarray(downloads, dtype=np.float64)
+        prev_downloads = np.asarray(prev_downloads, dtype=np.float64)
+        downloads_growth = _growth(downloads, prev_downloads)
+
+    # Weekly rates, never dividing by less than a week
+    weeks = np.maximum(1, np.maximum(1, days) / 7)
+    return {
+        'likes_growth': likes_growth,
+        'downloads_growth': downloads_growth,
+        'weekly_likes_growth': likes_growth / weeks,
+        'weekly_downloads_growth': downloads_growth / weeks
+    }
+
+def score_candidates(likes, downloads, prev_likes, prev_downloads, days, is_new):
+    """Score every candidate in one vectorized pass.
+
+    All arguments are equal-length arrays; prev_* and days are ignored where
+    is_new is True. Pass downloads=None for repos without download counts
+    (Spaces). Returns the dict of growth_metrics() with two more arrays:
+
+    - score: the largest growth as a multiple of its threshold, so any score
+      above 1 clears at least one threshold
+    - worthy: the same boolean decision as Database.is_model_worth_featuring
+    """
+    days = np.asarray(days, dtype=np.float64)
+    is_new = np.asarray(is_new, dtype=bool)
+    growth = growth_metrics(likes, downloads, prev_likes, prev_downloads, days)
+
+    score = np.maximum.reduce([
+        growth['weekly_likes_growth'] / WEEKLY_LIKES_GROWTH,
+        growth['weekly_downloads_growth'] / WEEKLY_DOWNLOADS_GROWTH,
+        growth['likes_growth'] / TOTAL_LIKES_GROWTH,
+        growth['downloads_growth'] / TOTAL_DOWNLOADS_GROWTH
+    ])
+
+    worthy = is_new | ((days >= COOLDOWN_DAYS) & (score > 1))
+    score = np.where(is_new, NEW_MODEL_SCORE, np.where(worthy, score, -np.inf))
+    return {**growth, 'score': score, 'worthy': worthy}
+
+def top_k(score, worthy, k):
+    """Return indices of the k best worthy candidates, best first.
+
+    Ties keep their original order, so equal scores stay in download order.
+    """
+    candidates = np.flatnonzero(worthy)
+    order = np.argsort(-score[candidates], kind='stable')
+    return candidates[order[:k]]
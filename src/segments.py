@@ -0,0 +1,80 @@
+def _filters(segment):
+    """A segment's tag, author and excluded author lists as lowercase sets."""
+    return tuple(
+        frozenset(value.lower() for value in segment[key])
+        for key in ('tags', 'authors', 'exclude_authors')
+    )
+
+def _project_key(project):
+    return (
+        (project.get('author') or '').lower(),
+        frozenset(str(tag).lower() for tag in project.get('tags') or [])
+    )
+
+def _masks(projects):
+    """Bitmasks of the projects carrying each tag and by each author."""
+    tags, authors = {}, {}
+    for index, project in enumerate(projects):
+        bit = 1 << index
+        author, project_tags = _project_key(project)
+        authors[author] = authors.get(author, 0) | bit
+        for tag in project_tags:
+            tags[tag] = tags.get(tag, 0) | bit
+    return tags, authors
+
+def _union(masks, keys):
+    combined = 0
+    for key in keys:
+        combined |= masks.get(key, 0)
+    return combined
+
+def group_recipients(projects, recipients, subscriber_segments, segments):
+    """Split an edition's recipients by the projects they should get.
+    
+    A project matches a segment when it has one of the segment's tags (if
+    any), is by one of its authors (if any) and is not by an excluded
+    author. Comparisons ignore case.
+    
+    Recipients without a (known) segment, and segments that match every
+    project, get the full edition. Segments that select the same projects
+    share a group. Returns (full_recipients, groups, skipped): each group is
+    a dict with 'projects', 'segments' and 'recipients', and skipped counts
+    recipients whose segment matches nothing in this edition.
+    """
+    # A segment's selection is a bitmask over the projects, built from
+    # per-tag and per-author masks, so matching costs the size of the
+    # segment's filters rather than the number of projects
+    tag_masks, author_masks = _masks(projects)
+    everything = (1 << len(projects)) - 1
+    selections = {}
+    for name, segment in segments.items():
+        tag_filter, authors, excluded = _filters(segment)
+        mask = everything
+        if tag_filter:
+            mask &= _union(tag_masks, tag_filter)
+        if authors:
+            mask &= _union(author_masks, authors)
+        mask &= ~_union(author_masks, excluded)
+        selections[name] = mask
+    
+    full, groups, skipped = [], {}, 0
+    for recipient in recipients:
+        name = subscriber_segments.get(recipient)
+        mask = selections.get(name, everything)
+        if mask == everything:
+            full.append(recipient)
+        elif not mask:
+            skipped += 1
+        else:
+            group = groups.get(mask)
+            if group is None:
+                group = groups[mask] = {
+                    'projects': [project for index, project in enumerate(projects) if mask >> index & 1],
+                    'segments': {},
+                    'recipients': []
+                }
+            group['segments'][name] = None
+            group['recipients'].append(recipient)
+    for group in groups.values():
+        group['segments'] = list(group['segments'])
+    return full, list(groups.values()), skipped
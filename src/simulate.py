@@ -0,0 +1,411 @@
+import csv
+import functools
+import itertools
+import logging
+
+import numpy as np
+
+from database import DAY_SECONDS, FULL_RESOLUTION_DAYS, WEEK_SECONDS
+from scoring import (
+    COOLDOWN_DAYS, WEEKLY_LIKES_GROWTH, WEEKLY_DOWNLOADS_GROWTH, TOTAL_LIKES_GROWTH,
+    TOTAL_DOWNLOADS_GROWTH, NEW_MODEL_SCORE, growth_metrics
+)
+
+logger = logging.getLogger('hf_newsletter')
+
+DEFAULT_LIMIT = 10  # Repos featured per type, as in newsletter.DEFAULT_LIMIT
+
+# The featuring thresholds, in the order of a combination's values
+THRESHOLDS = ('cooldown_days', 'weekly_likes_growth', 'weekly_downloads_growth',
+              'total_likes_growth', 'total_downloads_growth')
+PRODUCTION = (COOLDOWN_DAYS, WEEKLY_LIKES_GROWTH, WEEKLY_DOWNLOADS_GROWTH,
+              TOTAL_LIKES_GROWTH, TOTAL_DOWNLOADS_GROWTH)
+
+def _steps(start, stop, step):
+    """start, start + step, ... up to and including stop."""
+    return [round(float(value), 6) for value in np.arange(start, stop + step / 2, step)]
+
+# 4 * 9 * 7 * 4 * 4 = 4032 combinations around the production values
+DEFAULT_GRID = {
+    'cooldown_days': [7, 14, 21, 28],
+    'weekly_likes_growth': _steps(0.10, 0.50, 0.05),
+    'weekly_downloads_growth': _steps(0.25, 1.00, 0.125),
+    'total_likes_growth': [1.0, 2.0, 3.0, 4.0],
+    'total_downloads_growth': [2.5, 5.0, 7.5, 10.0]
+}
+
+# The growth_metrics() each threshold after the cooldown applies to
+GROWTH = {
+    'weekly_likes_growth': 'weekly_likes_growth',
+    'weekly_downloads_growth': 'weekly_downloads_growth',
+    'total_likes_growth': 'likes_growth',
+    'total_downloads_growth': 'downloads_growth'
+}
+
+RESULT_COLUMNS = THRESHOLDS + ('editions', 'featured_mean', 'featured_min', 'featured_max',
+                               'empty_fraction')
+
+def parse_grid(specs=None):
+    """Threshold grid from 'name=v1,v2,...' or 'name=start:stop:step' specs.
+    
+    Thresholds that are not given keep their DEFAULT_GRID values.
+    """
+    grid = dict(DEFAULT_GRID)
+    for spec in specs or []:
+        name, sep, values = spec.partition('=')
+        name = name.strip().replace('-', '_')
+        if not sep or name not in THRESHOLDS:
+            raise ValueError(f"Grid spec must look like {'|'.join(THRESHOLDS)}=VALUES: {spec!r}")
+        try:
+            if ':' in values:
+                start, stop, step = (float(value) for value in values.split(':'))
+                grid[name] = _steps(start, stop, step) if step > 0 else []
+            else:
+                grid[name] = [float(value) for value in values.split(',')]
+        except ValueError:
+            raise ValueError(f"Invalid values in grid spec: {spec!r}")
+        lowest = 0 if name == 'cooldown_days' else np.nextafter(0, 1)
+        if not grid[name] or min(grid[name]) < lowest:
+            raise ValueError(f"Grid spec needs positive values: {spec!r}")
+    return grid
+
+def load_history(db, since=None, repo_types=None):
+    """Read the snapshot history into dense (edition, repo) arrays.
+    
+    Every run's snapshot timestamp is one edition. Snapshots from before the
+    full-resolution window are downsampled to each model's last one per week
+    (see Database.prune_snapshots), which leaves repos that dropped out of
+    the listing mid-week on an earlier timestamp of their week. There, only
+    the last timestamp of each week is an edition; the others are skipped.
+    Missing counts are NaN.
+    """
+    columns, type_codes, column_types = {}, {}, []
+    timestamps, offsets = [], []
+    indices, likes, downloads = [], [], []
+    for rows in db.iter_snapshot_history(since, repo_types):
+        for ts, repo_type, model_id, model_likes, model_downloads, _ in rows:
+            if not timestamps or timestamps[-1] != ts:
+                timestamps.append(ts)
+                offsets.append(len(indices))
+            column = columns.get(model_id)
+            if column is None:
+                column = columns[model_id] = len(columns)
+                column_types.append(type_codes.setdefault(repo_type, len(type_codes)))
+            indices.append(column)
+            likes.append(np.nan if model_likes is None else model_likes)
+            downloads.append(np.nan if model_downloads is None else model_downloads)
+    offsets.append(len(indices))
+    
+    # The window is measured from the latest run of any type, as the
+    # pruning after that run measured it
+    latest = db.get_latest_snapshot_ts()
+    ts = np.asarray(timestamps, dtype=np.int64)
+    downsampled = ts < (latest or 0) - FULL_RESOLUTION_DAYS * DAY_SECONDS
+    week = ts // WEEK_SECONDS
+    last_of_week = np.append((week[1:] != week[:-1]) | ~downsampled[1:], True)
+    keep = np.flatnonzero(~downsampled | last_of_week)
+    if len(keep) < len(ts):
+        logger.info(f"Skipping {len(ts) - len(keep)} downsampled mid-week snapshot timestamps")
+    indices = np.asarray(indices, dtype=np.int64)
+    history = {
+        'ts': ts[keep],
+        'likes': np.full((len(keep), len(columns)), np.nan),
+        'downloads': np.full((len(keep), len(columns)), np.nan),
+        'columns': [],
+        'types': np.asarray(column_types, dtype=np.int64),
+        'repo_types': list(type_codes)
+    }
+    for edition, run in enumerate(keep):
+        rows = slice(offsets[run], offsets[run + 1])
+        history['likes'][edition, indices[rows]] = likes[rows]
+        history['downloads'][edition, indices[rows]] = downloads[rows]
+        # In rank order within each repo type, so ties break as in top_k()
+        history['columns'].append(indices[rows])
+    return history
+
+def _growth(history, edition, columns, last):
+    """growth_metrics() and days of repos last featured at editions `last` (-1: never)."""
+    is_new = last < 0
+    seen = np.where(is_new, edition, last)
+    # A download count missing on either side (always, for Spaces) counts
+    # as no growth
+    current = history['downloads'][edition, columns]
+    previous = history['downloads'][seen, columns]
+    missing = np.isnan(current) | np.isnan(previous)
+    days = (history['ts'][edition] - history['ts'][seen]) // DAY_SECONDS
+    growth = growth_metrics(history['likes'][edition, columns], np.where(missing, 1, current),
+                            history['likes'][seen, columns], np.where(missing, 1, previous), days)
+    return growth, days, is_new
+
+def _fold(pairs, starts, combine):
+    """Combine the rows of consecutive pairs of the same repo with a ufunc.
+    
+    starts holds the first pair of each repo. Repos have only a few states,
+    so this combines the second pairs of all repos at once, then the third,
+    and so on, which is much faster than ufunc.reduceat() over many rows.
+    """
+    if len(starts) == len(pairs):
+        return pairs
+    group = np.repeat(np.arange(len(starts)), np.diff(starts, append=len(pairs)))
+    rank = np.arange(len(pairs)) - starts[group]
+    folded = pairs[starts]
+    for level in range(1, rank.max() + 1):
+        at = np.flatnonzero(rank == level)
+        folded[group[at]] = combine(folded[group[at]], pairs[at])
+    return folded
+
+def _top(score, worthy, limit):
+    """Keep each combination's `limit` best worthy repos, as top_k() picks them.
+    
+    score and worthy are (repos, combinations) with repos in listing order,
+    so ties go to the repo listed first. Partitioning finds the limit-th best
+    score of each combination without sorting.
+    """
+    over = np.count_nonzero(worthy, axis=0) > limit
+    if not over.any():
+        return worthy
+    score = score(over)
+    cutoff = -np.partition(-score, limit - 1, axis=0)[limit - 1]
+    above = score > cutoff
+    ties = score == cutoff
+    room = limit - above.sum(axis=0)
+    chosen = worthy.copy()
+    chosen[:, over] = above | (ties & (np.cumsum(ties, axis=0) <= room))
+    return chosen
+
+def _positions(steps):
+    """Indicator matrix of the (cooldown step, threshold step) of each combination.
+    
+    Has one block of columns per threshold after the cooldown, each block
+    laid out as (cooldown steps, threshold steps), padded to the widest.
+    """
+    width = steps[1:].max() + 1
+    blocks = len(steps) - 1
+    positions = np.zeros((steps.shape[1], blocks * (steps[0].max() + 1) * width), dtype=np.float32)
+    for i in range(blocks):
+        column = (i * (steps[0].max() + 1) + steps[0]) * width + steps[i + 1]
+        positions[np.arange(steps.shape[1]), column] = 1
+    return positions
+
+def _reach(in_state, positions, shape):
+    """Which threshold steps the combinations in each group reach.
+    
+    in_state is (groups, combinations) and positions comes from
+    _positions(). Returns tables where tables[group, i, a, b] says that some
+    combination in the group has a cooldown below step a and threshold i + 1
+    below step b.
+    """
+    # Counting a group's combinations per position is a matrix product
+    reached = (in_state.astype(np.float32) @ positions > 0).reshape(
+        len(in_state), len(shape) - 1, shape[0], max(shape[1:])
+    )
+    tables = np.zeros(reached.shape[:2] + (shape[0] + 1, reached.shape[3] + 1), dtype=bool)
+    tables[:, :, 1:, 1:] = np.logical_or.accumulate(np.logical_or.accumulate(reached, axis=2), axis=3)
+    return tables
+
+class _ReachTables:
+    """_reach() tables of (repo, state) pairs, by default that of every combination.
+    
+    Featuring a repo moves combinations out of its older states, so their
+    tables can only overstate what those states reach. expire() marks them
+    stale rather than recomputing them all, and add() refreshes a table.
+    """
+    
+    def __init__(self, everything, repos, states):
+        self.tables = np.repeat(everything[None], 1024, axis=0)
+        self.count = 1
+        self.index = np.zeros((repos, states), dtype=np.int32)
+        self.stale = np.zeros((repos, states), dtype=bool)
+    
+    def possible(self, repo, state, passed):
+        """Whether some combination in each pair's state makes it worthy.
+        
+        passed comes from _passed(); new repos are always worthy.
+        """
+        tables = self.tables[self.index[repo, state]]
+        reached = np.zeros(len(tables), dtype=bool)
+        for i in range(1, passed.shape[1]):
+            reached |= tables[np.arange(len(tables)), i - 1, passed[:, 0], passed[:, i]]
+        return reached
+    
+    def expire(self, repos):
+        self.stale[repos] = True
+    
+    def add(self, repo, state, tables):
+        if self.count + len(tables) > len(self.tables):
+            # Drop the tables no pair uses any more, growing if that is not enough
+            used = np.unique(self.index[self.index > 0])
+            remap = np.zeros(len(self.tables), dtype=np.int32)
+            remap[used] = np.arange(1, len(used) + 1)
+            self.tables[1:len(used) + 1] = self.tables[used]
+            self.index = remap[self.index]
+            self.count = len(used) + 1
+            while 2 * (self.count + len(tables)) > len(self.tables):
+                self.tables = np.concatenate([self.tables, self.tables])
+        self.tables[self.count:self.count + len(tables)] = tables
+        self.index[repo, state] = np.arange(self.count, self.count + len(tables))
+        self.stale[repo, state] = False
+        self.count += len(tables)
+
+def _passed(growth, days, values, dtype):
+    """How many steps of each threshold each pair passes, as (pairs, thresholds).
+    
+    A pair is worthy for a combination when its cooldown has passed and any
+    growth clears its threshold, that is when the combination's step is
+    below the count on the cooldown and on any other threshold. The counts
+    use the same comparisons as score_candidates(), whose NaN scores are
+    never worthy.
+    """
+    passed = np.zeros((len(days), len(THRESHOLDS)), dtype=dtype)
+    passed[:, 0] = np.searchsorted(values[0], days, side='right')
+    with np.errstate(invalid='ignore'):
+        for i, name in enumerate(THRESHOLDS[1:], 1):
+            passed[:, i] = (growth[GROWTH[name]][:, None] / values[i] > 1).sum(axis=1)
+    passed[np.isnan(np.column_stack(list(growth.values()))).any(axis=1)] = 0
+    return passed
+
+def simulate(history, grid, limit=DEFAULT_LIMIT):
+    """Replay the history once for every combination of thresholds in grid.
+    
+    For each combination the simulation keeps the edition each repo was last
+    featured in. As with lean listings, growth is measured from that edition
+    and the cooldown counts days since then. Each edition features at most
+    `limit` repos per type, picked as top_k() picks them. The first edition
+    only seeds the state: everything in it counts as featured before the
+    history starts.
+    
+    Returns the (combinations, thresholds) array and the number of repos
+    featured by each combination in each edition after the first.
+    """
+    values = [np.array(sorted(set(grid[name])), dtype=np.float64) for name in THRESHOLDS]
+    shape = tuple(len(axis) for axis in values)
+    # Each combination as the step it takes on each threshold, and as values.
+    # Steps and _passed() counts share the smallest type that holds them all.
+    dtype = np.min_scalar_type(max(shape))
+    steps = np.array(list(itertools.product(*(range(size) for size in shape))), dtype=dtype).T.copy()
+    combinations = np.column_stack([axis[step] for axis, step in zip(values, steps)])
+    editions, repos = history['likes'].shape
+    if editions < 2:
+        raise ValueError("Simulating needs the snapshots of at least two runs")
+    
+    # last[repo, combination]: the edition the repo was last featured in, -1
+    # for never. Growth only depends on that edition, and a repo is only in a
+    # few distinct states across all combinations, so every edition scores
+    # (repo, state) pairs rather than (repo, combination) ones. present[repo, e]
+    # marks the states in use, with the final column for never, and reach
+    # holds the _reach() tables of the pairs whose state not every
+    # combination shares. Most pairs are not worthy for any combination in
+    # their state, and the tables rule those out before any work per
+    # combination.
+    last = np.full((repos, len(combinations)), -1,
+                   dtype=np.int16 if editions < np.iinfo(np.int16).max else np.int32)
+    last[history['columns'][0]] = 0
+    present = np.zeros((repos, editions + 1), dtype=bool)
+    present[:, -1] = True
+    present[history['columns'][0]] = np.arange(editions + 1) == 0
+    positions = _positions(steps)
+    reach = _ReachTables(_reach(np.ones((1, len(combinations)), dtype=bool), positions, shape)[0],
+                         repos, editions + 1)
+    featured = np.zeros((len(combinations), editions), dtype=np.int32)
+    
+    for edition in range(1, editions):
+        columns = history['columns'][edition]
+        repo, slot = np.nonzero(present[columns])
+        pairs = columns[repo]
+        state = np.where(slot == editions, -1, slot)
+        growth, days, is_new = _growth(history, edition, pairs, state)
+        passed = _passed(growth, days, values, dtype)
+        possible = is_new | reach.possible(pairs, slot, passed)
+        stale = possible & ~is_new & reach.stale[pairs, slot]
+        if stale.any():
+            reach.add(pairs[stale], slot[stale],
+                      _reach(last[pairs[stale]] == state[stale, None], positions, shape))
+            possible[stale] = reach.possible(pairs[stale], slot[stale], passed[stale])
+        if not possible.any():
+            continue
+        index = np.flatnonzero(possible)
+        repo, state, passed, is_new = repo[index], state[index], passed[index], is_new[index]
+        
+        # Only the combinations actually in a pair's state count
+        pair_worthy = steps[0] < passed[:, [0]]
+        clears = steps[1] < passed[:, [1]]
+        for i in range(2, len(THRESHOLDS)):
+            clears |= steps[i] < passed[:, [i]]
+        pair_worthy &= clears
+        pair_worthy |= is_new[:, None]
+        pair_worthy &= last[columns[repo]] == state[:, None]
+        # Pairs come in listing order; fold them into one row per repo
+        starts = np.flatnonzero(np.diff(repo, prepend=-1))
+        candidates = columns[repo[starts]]
+        worthy = _fold(pair_worthy, starts, np.logical_or)
+        
+        def score(first, end, over):
+            # Scores only matter where a combination has more worthy repos
+            # of a type than it can feature. A score is the largest growth
+            # as a multiple of its threshold, as in score_candidates(), so
+            # the multiples of each threshold's values are gathered by the
+            # combinations' steps.
+            rows = slice(starts[first], starts[end] if end < len(starts) else len(repo))
+            needed = pair_worthy[rows, over]
+            scored = needed.any(axis=1)
+            at = index[rows][scored]
+            best = np.full((len(at), np.count_nonzero(over)), -np.inf)
+            for i, name in enumerate(THRESHOLDS[1:], 1):
+                multiples = growth[GROWTH[name]][at, None] / values[i]
+                np.maximum(best, multiples[:, steps[i][over]], out=best)
+            best[is_new[rows][scored]] = NEW_MODEL_SCORE
+            score = np.full(needed.shape, -np.inf)
+            score[scored] = np.where(needed[scored], best, -np.inf)
+            return _fold(score, starts[first:end] - starts[first], np.maximum)
+        
+        # The listing groups repos by type, and each type has its own limit
+        chosen = np.empty_like(worthy)
+        bounds = np.flatnonzero(np.diff(history['types'][candidates], prepend=-1, append=-1))
+        for first, end in zip(bounds[:-1], bounds[1:]):
+            chosen[first:end] = _top(functools.partial(score, first, end), worthy[first:end], limit)
+        featured[:, edition] = np.count_nonzero(chosen, axis=0)
+        
+        hit = chosen.any(axis=1)
+        if hit.any():
+            changed = candidates[hit]
+            last[changed] = np.where(chosen[hit], edition, last[changed])
+            present[changed] = False
+            present[changed[:, None], last[changed]] = True
+            reach.expire(changed)
+            reach.add(changed, np.full(len(changed), edition), _reach(chosen[hit], positions, shape))
+    return combinations, featured[:, 1:]
+
+def summarize(combinations, featured):
+    """One result row per combination, in RESULT_COLUMNS order."""
+    editions = featured.shape[1]
+    stats = np.column_stack([
+        np.full(len(combinations), editions),
+        featured.mean(axis=1),
+        featured.min(axis=1),
+        featured.max(axis=1),
+        (featured == 0).mean(axis=1)
+    ])
+    return [tuple(row) for row in np.column_stack([combinations, stats]).tolist()]
+
+def production_result(results):
+    """The result row of the thresholds in use today, if the grid has them."""
+    for row in results:
+        if np.allclose(row[:len(THRESHOLDS)], PRODUCTION):
+            return dict(zip(RESULT_COLUMNS, row))
+    return None
+
+def write_results(results, out):
+    writer = csv.writer(out)
+    writer.writerow(RESULT_COLUMNS)
+    for row in results:
+        writer.writerow(f"{value:.6g}" for value in row)
+
+def run_simulation(db, grid=None, limit=None, since=None, repo_types=None):
+    """Load the history, run the grid and return the summarized rows."""
+    history = load_history(db, since, repo_types)
+    logger.info(
+        f"Replaying {len(history['ts'])} editions of {history['likes'].shape[1]} repos "
+        f"({', '.join(history['repo_types']) or 'no snapshots'})"
+    )
+    combinations, featured = simulate(history, grid or DEFAULT_GRID, limit or DEFAULT_LIMIT)
+    return summarize(combinations, featured)